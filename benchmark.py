@@ -0,0 +1,200 @@
+"""
+Offline benchmark of download pipeline against local mock ESUP (mockesup.py).
+Builds synthetic workbooks, runs main() for every size in separate process, so peak RSS belongs to that run only,
+and reports rows/s, p50/p99 latency of stages and peak RSS. Saved results can be used as baseline for next runs.
+Startup time of CLI is measured separately by startup command.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import typer
+import asyncio
+import tempfile
+import statistics
+import subprocess
+from typing import List
+from typing_extensions import Annotated
+
+app = typer.Typer(help='Benchmarks of extruder against local mock server.')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# modules which must not be imported by extruder until command needs them
+HEAVY = ['pandas', 'numpy', 'openpyxl', 'requests', 'aiohttp', 'webassets']
+
+
+class silent:
+    """Subscriber which ignores events"""
+
+    async def event(self, val):
+        pass
+
+    async def batch(self, vals):
+        pass
+
+
+def workbook(path: str, size: int) -> None:
+    """Workbook with header and size ids in the first column"""
+
+    import openpyxl
+
+    book = openpyxl.Workbook(write_only=True)
+    ws = book.create_sheet('ids')
+    ws.append(['esupid', 'comment'])
+    for n in range(size):
+        ws.append([100000 + n, f'row {n}'])
+    book.save(path)
+
+
+def waitport(port: int, timeout: float = 15.0) -> None:
+    """Wait until mock server accepts connections"""
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Mock server did not start on port {port}')
+
+
+def written(checkpoint: str) -> int:
+    """Rows written by run, every one is a line of checkpoint of result"""
+
+    if not os.path.exists(checkpoint):
+        return 0
+    with open(checkpoint, 'r', encoding='utf-8') as f:
+        return sum(1 for line in f if line.strip())
+
+
+def peakrss() -> int:
+    """Peak resident memory of this process, KB"""
+
+    try:
+        import resource
+    except ImportError:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@app.command()
+def run(size: Annotated[int, typer.Option('--size')],
+        port: Annotated[int, typer.Option('--port')] = 8765,
+        concurrency: Annotated[int, typer.Option('--concurrency')] = 16,
+        batch: Annotated[int, typer.Option('--batch')] = 200) -> None:
+    """One run of main() against running mock server, prints JSON line with results, fails if rows are lost"""
+
+    os.environ['ESUPPATH'] = f'127.0.0.1:{port}'
+    os.environ['ESUPAUTH'] = 'none'
+    sys.path.insert(0, HERE)
+    import extruder
+
+    with tempfile.TemporaryDirectory() as tmp:
+        book = os.path.join(tmp, 'ids.xlsx')
+        workbook(book, size)
+
+        extruder.metrics.reset()
+        start = time.monotonic()
+        cnt = asyncio.run(extruder.main(book, None, 0, 0, silent(), concurrency=concurrency, batch=batch,
+                                        cache_path=os.path.join(tmp, 'cache.sqlite'),
+                                        output=os.path.join(tmp, 'datas.csv'), resume=False))
+        elapsed = time.monotonic() - start
+        rows = written(os.path.join(tmp, 'datas.csv.checkpoint'))
+
+    summary = extruder.metrics.summary()
+    stages = {key[len('esup_stage_seconds'):]: {'p50': val['p50'], 'p99': val['p99']}
+              for key, val in summary['histograms'].items() if key.startswith('esup_stage_seconds')}
+    print(json.dumps({'size': size, 'scheduled': cnt, 'rows': rows, 'seconds': elapsed, 'rows_per_second': rows / elapsed,
+                      'peak_rss_kb': peakrss(), 'stages': stages}, ensure_ascii=False))
+    if rows < size:
+        print(f'Written {rows} rows of {size}', file=sys.stderr)
+        raise typer.Exit(1)
+
+
+@app.command()
+def suite(sizes: Annotated[List[int], typer.Option('--size', help='Number of ids, may be repeated')] = None,
+          port: Annotated[int, typer.Option('--port')] = 8765,
+          latency: Annotated[float, typer.Option('--latency')] = 0.02,
+          errors: Annotated[float, typer.Option('--errors')] = 0.0,
+          page_kb: Annotated[int, typer.Option('--page-kb')] = 100,
+          concurrency: Annotated[int, typer.Option('--concurrency')] = 16,
+          batch: Annotated[int, typer.Option('--batch')] = 200,
+          save: Annotated[str, typer.Option('--save', help='Save results to JSON file')] = None,
+          baseline: Annotated[str, typer.Option('--baseline', help='Fail if slower than results in this file')] = None,
+          tolerance: Annotated[float, typer.Option('--tolerance', help='Allowed slowdown against baseline')] = 0.2) -> None:
+    """Start mock server and run benchmark for every size"""
+
+    sizes = sizes or [1000, 10000]
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, 'mockesup.py'), '--port', str(port),
+                               '--latency', str(latency), '--errors', str(errors), '--page-kb', str(page_kb)])
+    results, failed = list(), list()
+    try:
+        waitport(port)
+        for size in sizes:
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), 'run', '--size', str(size), '--port', str(port),
+                                  '--concurrency', str(concurrency), '--batch', str(batch)],
+                                 capture_output=True, text=True)
+            if out.returncode:
+                print(f'{size:>7} ids: failed, {out.stderr.strip()}')
+                failed.append(size)
+                continue
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            results.append(result)
+            stages = ' '.join(f'{name} p50={val["p50"]:.3f} p99={val["p99"]:.3f}' for name, val in result['stages'].items())
+            print(f'{size:>7} ids: {result["rows_per_second"]:8.1f} rows/s, {result["seconds"]:7.1f} s, '
+                  f'peak RSS {result["peak_rss_kb"] / 1024:.0f} MB | {stages}')
+    finally:
+        server.terminate()
+        server.wait()
+
+    if save:
+        with open(save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if baseline:
+        with open(baseline, 'r', encoding='utf-8') as f:
+            before = {r['size']: r for r in json.load(f)}
+        slow = [r for r in results if r['size'] in before and
+                r['rows_per_second'] < before[r['size']]['rows_per_second'] * (1 - tolerance)]
+        for r in slow:
+            print(f'Regression for {r["size"]} ids: {r["rows_per_second"]:.1f} rows/s, '
+                  f'baseline {before[r["size"]]["rows_per_second"]:.1f} rows/s')
+        if slow:
+            raise typer.Exit(1)
+
+    if failed:
+        raise typer.Exit(1)
+
+
+@app.command()
+def startup(runs: Annotated[int, typer.Option('--runs', help='Launches of CLI')] = 10,
+            budget: Annotated[float, typer.Option('--budget', help='Fail if median time of --help is above, ms')] = None) -> None:
+    """Time of extruder --help in new process and check that heavy modules are not imported at start"""
+
+    script = os.path.join(HERE, 'extruder.py')
+    times = list()
+    for _ in range(runs):
+        start = time.monotonic()
+        subprocess.run([sys.executable, script, '--help'], capture_output=True, check=True)
+        times.append((time.monotonic() - start) * 1000)
+
+    check = f'import sys, json; sys.path.insert(0, {HERE!r}); import extruder; print(json.dumps(sorted(sys.modules)))'
+    out = subprocess.run([sys.executable, '-c', check], capture_output=True, text=True, check=True)
+    loaded = [name for name in HEAVY if name in json.loads(out.stdout)]
+
+    median = statistics.median(times)
+    print(json.dumps({'runs': runs, 'median_ms': median, 'max_ms': max(times), 'heavy_imports': loaded}))
+    if loaded:
+        print(f'Imported at start: {", ".join(loaded)}')
+    if budget is not None and median > budget:
+        print(f'Startup {median:.0f} ms is above budget {budget:.0f} ms')
+    if loaded or (budget is not None and median > budget):
+        raise typer.Exit(1)
+
+
+if __name__ == '__main__':
+    app()
@@ -2,39 +2,62 @@
 Autor: Vladimir Mankus
 Company: Megafon
 This CLI utility help dowloads data from unified project management system (ESUP) made in asynchronous style.
+Heavy modules (pandas, openpyxl, requests, aiohttp) are imported where they are needed, so --help and small runs start fast.
 """
 
 import os
 import re
+import sys
 import zlib
 import json
 import time
+import glob
 import typer
+import bisect
+import pstats
 import base64
-import pickle
+import random
+import hashlib
+import inspect
 import asyncio
+import sqlite3
+import cProfile
 import datetime
-import requests
-import pandas as pd
-from aiohttp import web
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import List
+from urllib.parse import urlsplit
 from typing_extensions import Annotated
-from requests_negotiate_sspi import HttpNegotiateAuth
 
 app = typer.Typer(help='Application for easiest get datas from esup.')
 
+DEFAULT_TASK = 'Готовность к работам по БС'
+DEFAULT_PARAM = 'Дата готовности к работам по БС'
+# endpoint of saving task parameters is not known for sure, nothing is sent until it is set explicitly
+SAVE_METHOD = os.environ.get('ESUPSAVE')
+
 class http:
     """
     Just requests to server.
     Just because requests are not asincro and must be lunched in other thread.
     And all this because aiohttp not supported httpnegotiateauth.
     And also namespaces are one honking great idea -- let's do more of those!
+
+    All objects share one session: connections are pooled per host and kept alive,
+    so the negotiate handshake is done once per connection, not once per request.
     """
 
+    pool_size = 32
+    authfactory = None
+    _session = None
+    _lock = threading.Lock()
+
     def __init__(self, headers: dict) -> None:
-        self.auth = HttpNegotiateAuth()
-        self.headers = self.do_main_headers(headers)
+        self.headers = dict(headers)
 
-    def do_main_headers(self, extra: dict) -> dict:
+    @staticmethod
+    def do_main_headers(extra: dict) -> dict:
         """Create main headers"""
 
         headers = {
@@ -46,16 +69,731 @@ class http:
         }
         headers.update(extra)
         return headers
-    
+
+    @classmethod
+    def session(cls) -> 'requests.Session':
+        """Shared session for all threads, created once"""
+
+        if cls._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            with cls._lock:
+                if cls._session is None:
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=cls.pool_size, pool_block=True)
+                    session = requests.Session()
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    session.auth = cls.auth()
+                    session.headers.update(cls.do_main_headers(dict()))
+                    cls._session = session
+        return cls._session
+
+    @classmethod
+    def auth(cls) -> object:
+        """
+        Auth for session: authfactory if it is set, else by ESUPAUTH environment variable,
+        negotiate (default) or none for local test server.
+        """
+
+        if cls.authfactory is not None:
+            return cls.authfactory()
+
+        mode = os.environ.get('ESUPAUTH', 'negotiate').lower()
+        if mode == 'none':
+            return None
+        if mode != 'negotiate':
+            raise ValueError(f'Unknown ESUPAUTH: {mode}')
+        try:
+            from requests_negotiate_sspi import HttpNegotiateAuth
+        except ImportError:
+            # SSPI exists only on Windows, elsewhere auth is chosen by ESUPAUTH
+            raise RuntimeError('requests_negotiate_sspi is not available, set ESUPAUTH=none for test server')
+        return HttpNegotiateAuth()
+
+    @classmethod
+    def configure(cls, pool_size: int) -> None:
+        """Set connections per host, session is recreated only if size grows"""
+
+        with cls._lock:
+            if pool_size <= cls.pool_size:
+                return
+            if cls._session is not None:
+                cls._session.close()
+                cls._session = None
+            cls.pool_size = pool_size
+
     def get(self, url: str) -> object:
         """Get request in separate thread"""
-        return requests.get(url=url, auth=self.auth, headers=self.headers)
+        return self.session().get(url=url, headers=self.headers)
     
     def post(self, url: str, data: str) -> object:
-        """Post request in separate thread"""
+        """Post request in separate thread, Content-Length is set by requests for every call"""
+        return self.session().post(url=url, data=data, headers=self.headers)
+
+    def scan(self, url: str, factory: object, chunk_size: int = 65536, drain: int = 1 << 20) -> object:
+        """
+        Get request in separate thread which reads body by chunks and feeds them to scanner made by factory.
+        Result of scanner is stored in response.item, the body itself is not kept.
+        A short rest of body is drained, so connection goes back to pool instead of new handshake.
+        """
+
+        scanner = factory()
+        r = self.session().get(url=url, headers=self.headers, stream=True)
+        r.item = None
+        r.received = 0
+        try:
+            if 199 < r.status_code < 400:
+                chunks = r.iter_content(chunk_size)
+                for chunk in chunks:
+                    r.received += len(chunk)
+                    if scanner.feed(chunk):
+                        break
+                r.item = scanner.item
+                for chunk in chunks:
+                    r.received += len(chunk)
+                    drain -= len(chunk)
+                    if drain < 0:
+                        break
+        finally:
+            r.close()
+        return r
+
+class reply:
+    """Response of aiohttpclient with the part of requests.Response interface which extruder uses"""
+
+    def __init__(self, status_code: int, headers: dict, content: bytes = b'') -> None:
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.item = None
+        self.received = len(content)
+
+    def json(self) -> object:
+        return json.loads(self.content)
+
+
+class aiohttpclient:
+    """
+    The same requests as http, but native async on aiohttp: no thread per request,
+    one session with pooled connections per event loop.
+    Negotiate auth goes through negotiator hook: callable(host) returning context with step(token) -> token,
+    by default spnego (pyspnego) is used. Kerberos is expected, NTLM needs several legs on one connection.
+    """
+
+    limit = 256
+    negotiator = None
+    _sessions = dict()
+    _negotiated = set()
+
+    def __init__(self, headers: dict) -> None:
+        self.headers = dict(headers)
+
+    @classmethod
+    def session(cls) -> 'aiohttp.ClientSession':
+        """Session of running event loop"""
+
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        session = cls._sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=cls.limit, limit_per_host=cls.limit)
+            headers = http.do_main_headers(dict())
+            headers.pop('Connection')
+            session = aiohttp.ClientSession(connector=connector, headers=headers,
+                                            timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=300))
+            cls._sessions[loop] = session
+        return session
+
+    @classmethod
+    async def close(cls) -> None:
+        """Close session of running event loop"""
+
+        session = cls._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    @classmethod
+    def token(cls, host: str) -> str:
+        """Authorization header for host"""
+
+        if cls.negotiator is not None:
+            context = cls.negotiator(host)
+        else:
+            try:
+                import spnego
+            except ImportError:
+                raise RuntimeError('Negotiate auth for aio transport needs pyspnego or aiohttpclient.negotiator')
+            context = spnego.client(hostname=host, service='HTTP', protocol='negotiate')
+        return 'Negotiate ' + base64.b64encode(context.step(None)).decode()
+
+    async def send(self, method: str, url: str, data: object = None) -> 'aiohttp.ClientResponse':
+        """Request with negotiate handshake when server asks for it"""
+
+        host = urlsplit(url).hostname
+        headers = dict(self.headers)
+        auth = os.environ.get('ESUPAUTH', 'negotiate').lower() != 'none'
+        if auth and host in self._negotiated:
+            headers['Authorization'] = self.token(host)
+
+        r = await self.session().request(method, url, data=data, headers=headers)
+        challenge = r.headers.get('WWW-Authenticate', '')
+        if r.status == 401 and auth and 'Authorization' not in headers and challenge.lower().startswith('negotiate'):
+            r.release()
+            self._negotiated.add(host)
+            headers['Authorization'] = self.token(host)
+            r = await self.session().request(method, url, data=data, headers=headers)
+        return r
+
+    async def get(self, url: str) -> reply:
+        """Get request"""
+
+        async with await self.send('GET', url) as r:
+            return reply(r.status, r.headers, await r.read())
+
+    async def post(self, url: str, data: str) -> reply:
+        """Post request"""
+
+        async with await self.send('POST', url, data) as r:
+            return reply(r.status, r.headers, await r.read())
+
+    async def scan(self, url: str, factory: object, chunk_size: int = 65536, drain: int = 1 << 20) -> reply:
+        """Get request which feeds body to scanner by chunks, the same as http.scan"""
+
+        scanner = factory()
+        async with await self.send('GET', url) as r:
+            result = reply(r.status, r.headers)
+            if 199 < r.status < 400:
+                done = False
+                async for chunk in r.content.iter_chunked(chunk_size):
+                    result.received += len(chunk)
+                    if done:
+                        drain -= len(chunk)
+                        if drain < 0:
+                            break
+                    elif scanner.feed(chunk):
+                        done = True
+                        result.item = scanner.item
+            return result
+
+class itemscanner:
+    """
+    Incremental search of kendo.observable({Item: {...}}) in task page.
+    Bytes before Item are dropped, feeding stops as soon as the object after Item is balanced.
+    """
+
+    start = re.compile(rb'kendo\.observable\(\{\s*Item\s*:\s*\{')
+    outside = re.compile(rb'[{}"]')
+    inside = re.compile(rb'["\\]')
+    tail = 64
+
+    def __init__(self, limit: int = 32 << 20) -> None:
+        self.limit = limit
+        self.buffer = bytearray()
+        self.found = False
+        self.quoted = False
+        self.depth = 0
+        self.pos = 0
+        self.item = None
+
+    def feed(self, chunk: bytes) -> bool:
+        """Add chunk of page, returns True when nothing more is needed"""
+
+        buffer = self.buffer
+        buffer += chunk
+
+        if not self.found:
+            m = self.start.search(buffer)
+            if m is None:
+                del buffer[:-self.tail]
+                return False
+            del buffer[:m.end() - 1]
+            self.found = True
+
+        pos, size = self.pos, len(buffer)
+        while pos < size:
+            if self.quoted:
+                m = self.inside.search(buffer, pos)
+                if m is None:
+                    pos = size
+                elif buffer[m.start()] == 0x5c:
+                    if m.end() == size:
+                        # escape is split between chunks, wait for the next one
+                        pos = m.start()
+                        break
+                    pos = m.end() + 1
+                else:
+                    self.quoted = False
+                    pos = m.end()
+                continue
+
+            m = self.outside.search(buffer, pos)
+            if m is None:
+                pos = size
+                continue
+            pos = m.end()
+            c = buffer[m.start()]
+            if c == 0x22:
+                self.quoted = True
+            elif c == 0x7b:
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        self.item = json.loads(buffer[:pos])
+                    except ValueError:
+                        self.item = None
+                    return True
+
+        self.pos = pos
+        return size > self.limit
+
+class metrics:
+    """
+    Process wide counters and latency histograms: pipeline stages, requests, waiting for free slot.
+    Rendered in Prometheus text format for /metrics and as dict for JSON summary of run.
+    """
+
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    histograms = dict()
+    counters = dict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def labels(labels: dict) -> tuple:
+        """Hashable labels"""
+
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    @classmethod
+    def observe(cls, name: str, seconds: float, **labels) -> None:
+        """Add value to histogram"""
+
+        key = (name, cls.labels(labels))
+        with cls._lock:
+            hist = cls.histograms.get(key)
+            if hist is None:
+                hist = cls.histograms[key] = {'buckets': [0] * (len(cls.buckets) + 1), 'sum': 0.0, 'count': 0}
+            hist['buckets'][bisect.bisect_left(cls.buckets, seconds)] += 1
+            hist['sum'] += seconds
+            hist['count'] += 1
+
+    @classmethod
+    def count(cls, name: str, value: int = 1, **labels) -> None:
+        """Increase counter"""
+
+        key = (name, cls.labels(labels))
+        with cls._lock:
+            cls.counters[key] = cls.counters.get(key, 0) + value
+
+    @classmethod
+    def quantile(cls, hist: dict, q: float) -> float:
+        """Quantile estimated from histogram buckets by linear interpolation"""
+
+        rank = q * hist['count']
+        seen, lower = 0, 0.0
+        for upper, n in zip(cls.buckets + (float('inf'),), hist['buckets']):
+            if n and seen + n >= rank:
+                if upper == float('inf'):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+            lower = upper
+        return lower
+
+    @staticmethod
+    def labeltext(labels: tuple, extra: str = '') -> str:
+        """Labels in Prometheus format"""
+
+        text = ','.join(f'{k}="{v}"' for k, v in labels)
+        if extra:
+            text = f'{text},{extra}' if text else extra
+        return '{' + text + '}' if text else ''
+
+    @classmethod
+    def prometheus(cls) -> str:
+        """All metrics in Prometheus text format"""
+
+        lines = list()
+        with cls._lock:
+            typed = set()
+            for (name, labels), hist in sorted(cls.histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f'# TYPE {name} histogram')
+                total = 0
+                for upper, n in zip(cls.buckets + ('+Inf',), hist['buckets']):
+                    total += n
+                    le = cls.labeltext(labels, 'le="%s"' % upper)
+                    lines.append(f'{name}_bucket{le} {total}')
+                lines.append(f'{name}_sum{cls.labeltext(labels)} {hist["sum"]}')
+                lines.append(f'{name}_count{cls.labeltext(labels)} {hist["count"]}')
+            for (name, labels), value in sorted(cls.counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f'# TYPE {name} counter')
+                lines.append(f'{name}{cls.labeltext(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def summary(cls) -> dict:
+        """Counters and histogram statistics as dict"""
+
+        result = {'histograms': dict(), 'counters': dict()}
+        with cls._lock:
+            for (name, labels), hist in cls.histograms.items():
+                result['histograms'][name + cls.labeltext(labels)] = {
+                    'count': hist['count'],
+                    'mean': hist['sum'] / hist['count'] if hist['count'] else 0.0,
+                    'p50': cls.quantile(hist, 0.5),
+                    'p99': cls.quantile(hist, 0.99)}
+            for (name, labels), value in cls.counters.items():
+                result['counters'][name + cls.labeltext(labels)] = value
+        return result
+
+    @classmethod
+    def reset(cls) -> None:
+        """Forget everything"""
+
+        with cls._lock:
+            cls.histograms.clear()
+            cls.counters.clear()
+
+
+class profiler:
+    """
+    cProfile of event loop thread and of every worker thread, merged into one report.
+    Before Python 3.12 profile sees only the thread which enabled it, so every worker has own profile
+    which is enabled only while it runs a request, and dump() reads stopped profiles.
+    Since 3.12 cProfile works through sys.monitoring: one profile sees all threads and second one can not be enabled.
+    Profiling never breaks download, profile which can not be enabled is skipped with warning.
+    """
+
+    shared = sys.version_info >= (3, 12)
+
+    def __init__(self) -> None:
+        self.profiles = list()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.main = None
+
+    def enable(self, profile: cProfile.Profile) -> bool:
+        """Enable profile, False if another profiler is active"""
+
+        try:
+            profile.enable()
+        except ValueError as e:
+            print(f'Profile is not collected: {e}', file=sys.stderr)
+            return False
+        return True
+
+    def thread(self) -> None:
+        """Start profile in thread of event loop"""
+
+        profile = cProfile.Profile()
+        if self.enable(profile):
+            self.main = profile
+            with self.lock:
+                self.profiles.append(profile)
+
+    def run(self, func: object, *args) -> object:
+        """Call func in worker thread under profile of this thread"""
+
+        if self.shared:
+            return func(*args)
+
+        profile = getattr(self.local, 'profile', None)
+        if profile is None:
+            profile = self.local.profile = cProfile.Profile()
+            with self.lock:
+                self.profiles.append(profile)
+
+        if not self.enable(profile):
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+
+    def dump(self, path: str, top: int = 30) -> None:
+        """Stop profiles, save merged stats to path and print the most expensive calls"""
+
+        if self.main is not None:
+            self.main.disable()
+        with self.lock:
+            profiles = [profile for profile in self.profiles if profile.getstats()]
+        if not profiles:
+            print('Nothing was profiled', file=sys.stderr)
+            return
+        stats = pstats.Stats(*profiles, stream=sys.stderr)
+        stats.dump_stats(path)
+        stats.sort_stats('cumulative').print_stats(top)
+
+
+class limiter:
+    """
+    Adaptive limit of requests in flight for one endpoint.
+    Additive increase while answers are fast, multiplicative decrease on errors and slow answers.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1, latency: float = 5.0) -> None:
+        self.maximum = maximum
+        self.minimum = minimum
+        self.latency = latency
+        self.limit = float(max(minimum, maximum // 2))
+        self.inflight = 0
+        self.decreased = 0.0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        """Wait for free slot"""
+
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
+
+    async def release(self, success: bool, elapsed: float) -> None:
+        """Free slot and adapt limit to the result of request"""
+
+        async with self.condition:
+            self.inflight -= 1
+            now = time.monotonic()
+            if success and elapsed < self.latency:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif now - self.decreased > elapsed:
+                # only one decrease for requests started in the same window
+                self.limit = max(self.minimum, self.limit / 2)
+                self.decreased = now
+            self.condition.notify_all()
+
+
+class scheduler:
+    """Runs blocking requests in threads with limits per endpoint and retries with jittered backoff"""
+
+    retry_codes = {429, 500, 502, 503, 504}
+    _shared = None
+
+    def __init__(self, concurrency: int = 16, retries: int = 3, backoff: float = 0.5, cap: float = 30.0,
+                 profile: profiler = None) -> None:
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.cap = cap
+        self.limiters = dict()
+        self.inflight = dict()
+        # all endpoints share one host, so threads and pooled connections are enough for three of them
+        self.profile = profile
+        self.executor = ThreadPoolExecutor(concurrency * 3, thread_name_prefix='esup')
+        http.configure(concurrency * 3)
+
+    @classmethod
+    def shared(cls) -> 'scheduler':
+        """Scheduler with default settings for objects created outside main"""
+
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def slot(self, endpoint: str) -> limiter:
+        """Limiter for endpoint, created on first use"""
+
+        if endpoint not in self.limiters:
+            self.limiters[endpoint] = limiter(self.concurrency)
+        return self.limiters[endpoint]
+
+    async def pause(self, attempt: int, retry_after: str = None) -> None:
+        """Sleep before next attempt, full jitter or server's Retry-After"""
+
+        delay = random.uniform(0, min(self.cap, self.backoff * 2 ** attempt))
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, min(self.cap, int(retry_after)))
+        await asyncio.sleep(delay)
+
+    @staticmethod
+    def errors() -> tuple:
+        """Network errors of transports, only loaded ones are checked as unused transport is never imported"""
+
+        result = [asyncio.TimeoutError]
+        if 'requests' in sys.modules:
+            result.append(sys.modules['requests'].RequestException)
+        if 'aiohttp' in sys.modules:
+            result.append(sys.modules['aiohttp'].ClientError)
+        return tuple(result)
+
+    def call(self, endpoint: str, queued: float, func: object, *args) -> object:
+        """Runs in worker thread, measures time spent in queue of thread pool"""
+
+        metrics.observe('esup_thread_wait_seconds', time.monotonic() - queued, endpoint=endpoint)
+        if self.profile is not None:
+            return self.profile.run(func, *args)
+        return func(*args)
+
+    async def request(self, endpoint: str, func: object, *args) -> object:
+        """Call func(*args) in thread or await it if it is async, returns response or None if server is unreachable"""
+
+        slot = self.slot(endpoint)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                metrics.count('esup_retries_total', endpoint=endpoint)
+            queued = time.monotonic()
+            await slot.acquire()
+            start = time.monotonic()
+            metrics.observe('esup_slot_wait_seconds', start - queued, endpoint=endpoint)
+            try:
+                if inspect.iscoroutinefunction(func):
+                    r = await func(*args)
+                else:
+                    r = await asyncio.get_running_loop().run_in_executor(self.executor, self.call, endpoint, start, func, *args)
+            except self.errors():
+                await slot.release(False, time.monotonic() - start)
+                metrics.count('esup_http_errors_total', endpoint=endpoint)
+                if attempt == self.retries:
+                    return None
+                await self.pause(attempt)
+                continue
+
+            elapsed = time.monotonic() - start
+            received = getattr(r, 'received', None)
+            metrics.observe('esup_request_seconds', elapsed, endpoint=endpoint)
+            metrics.count('esup_http_responses_total', endpoint=endpoint, code=r.status_code)
+            metrics.count('esup_received_bytes_total', len(r.content) if received is None else received, endpoint=endpoint)
+
+            success = r.status_code not in self.retry_codes
+            await slot.release(success, elapsed)
+            if success or attempt == self.retries:
+                return r
+            await self.pause(attempt, r.headers.get('Retry-After'))
+
+    async def once(self, endpoint: str, func: object, *args) -> object:
+        """
+        Single-flight request: callers asking for the same endpoint, method and arguments while it is in flight
+        wait for one shared future instead of sending it again. Only for requests which change nothing on server.
+        """
+
+        key = (endpoint, getattr(func, '__name__', func), args)
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.request(endpoint, func, *args))
+            self.inflight[key] = future
+            future.add_done_callback(lambda f: self.inflight.pop(key, None))
+        else:
+            metrics.count('esup_coalesced_total', endpoint=endpoint)
+        # cancelled caller must not cancel request of others
+        return await asyncio.shield(future)
+
+    def close(self) -> None:
+        """Stop threads of scheduler"""
+
+        self.executor.shutdown(wait=False)
+
+class activitycache:
+    """
+    Resolved identifiers of activities on disk, one row per activity and task.
+    SQLite in WAL mode: several processes may use one file, every entry is written as soon as it is resolved
+    and read only when the activity asks for it.
+    """
 
-        self.headers.update({"Content-Length": str(len(data))})
-        return requests.post(url=url, data=data, auth=self.auth, headers=self.headers)
+    day = 24 * 60 * 60
+    ttl = {'TemplateId': 30 * day, 'ViewId': 30 * day, 'TaskId': 7 * day}
+
+    def __init__(self, path: str = 'cache.sqlite', ttl: dict = None) -> None:
+        self.ttl = dict(self.ttl, **(ttl or dict()))
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS activities (activityId TEXT PRIMARY KEY, '
+                                'TemplateId, TemplateTime REAL, ViewId, ViewTime REAL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS tasks (activityId TEXT, name TEXT, '
+                                'TaskId, TaskTime REAL, PRIMARY KEY (activityId, name))')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS sync (activityId TEXT, name TEXT, GridHash TEXT, '
+                                'Value TEXT, FetchTime REAL, PRIMARY KEY (activityId, name))')
+
+    def get(self, activityId: str) -> dict:
+        """TemplateId and ViewId of activity which are not expired"""
+
+        with self.lock:
+            row = self.connection.execute('SELECT TemplateId, TemplateTime, ViewId, ViewTime FROM activities '
+                                          'WHERE activityId = ?', (activityId,)).fetchone()
+        if row is None:
+            return dict()
+
+        now = time.time()
+        result = dict()
+        if row[0] is not None and now - row[1] < self.ttl['TemplateId']:
+            result['TemplateId'] = row[0]
+        if row[2] is not None and now - row[3] < self.ttl['ViewId']:
+            result['ViewId'] = row[2]
+        return result
+
+    def put(self, activityId: str, TemplateId: object, ViewId: object) -> None:
+        """Save TemplateId and ViewId of activity"""
+
+        now = time.time()
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO activities VALUES (?, ?, ?, ?, ?)',
+                                    (activityId, TemplateId, now, ViewId, now))
+
+    def templates(self) -> set:
+        """Pairs of ViewId and TemplateId which are not expired, activities of one type share them"""
+
+        since = time.time() - min(self.ttl['TemplateId'], self.ttl['ViewId'])
+        with self.lock:
+            rows = self.connection.execute('SELECT DISTINCT ViewId, TemplateId FROM activities WHERE TemplateTime > ? '
+                                           'AND ViewTime > ? AND ViewId IS NOT NULL AND TemplateId IS NOT NULL',
+                                           (since, since)).fetchall()
+        return set(rows)
+
+    def task(self, activityId: str, name: str) -> object:
+        """TaskId of activity by task name or None if unknown or expired"""
+
+        with self.lock:
+            row = self.connection.execute('SELECT TaskId, TaskTime FROM tasks WHERE activityId = ? AND name = ?',
+                                          (activityId, name)).fetchone()
+        if row is None or time.time() - row[1] >= self.ttl['TaskId']:
+            return None
+        return row[0]
+
+    def tasks(self, activityId: str) -> dict:
+        """All tasks of activity which are not expired, name -> TaskId, they were saved from one grid row"""
+
+        since = time.time() - self.ttl['TaskId']
+        with self.lock:
+            rows = self.connection.execute('SELECT name, TaskId FROM tasks WHERE activityId = ? AND TaskTime > ?',
+                                           (activityId, since)).fetchall()
+        return dict(rows)
+
+    def puttasks(self, activityId: str, tasks: dict) -> None:
+        """Save all tasks of activity, name -> TaskId"""
+
+        now = time.time()
+        with self.lock:
+            self.connection.executemany('INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?)',
+                                        [(activityId, name, taskId, now) for name, taskId in tasks.items()])
+
+    def synced(self, name: str) -> dict:
+        """State of delta sync for task: activityId -> (hash of grid row, last values, time of fetch)"""
+
+        with self.lock:
+            rows = self.connection.execute('SELECT activityId, GridHash, Value, FetchTime FROM sync WHERE name = ?',
+                                           (name,)).fetchall()
+        return {row[0]: (row[1], json.loads(row[2]), row[3]) for row in rows}
+
+    def putsync(self, activityId: str, name: str, gridhash: str, value: dict) -> None:
+        """Save grid row hash and values of task fetched just now"""
+
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO sync VALUES (?, ?, ?, ?, ?)',
+                                    (activityId, name, gridhash, json.dumps(value, ensure_ascii=False, default=str),
+                                     time.time()))
+
+    def close(self) -> None:
+        """Close database"""
+
+        with self.lock:
+            self.connection.close()
 
 class extruder:
     """
@@ -63,8 +801,11 @@ class extruder:
     Class for storing identifiers and methods for their preparation.
     """
 
-    def __init__(self, activityId: int) -> None:
-        """Init class with esupid."""
+    json_http = http({"Content-Type": "application/json, text/javascript, */*; q=0.01"})
+    form_http = http({"Content-Type": "application/x-www-form-urlencoded; charset=UTF-8"})
+
+    def __init__(self, activityId: int, scheduler: scheduler = None, cache: activitycache = None, client: type = None) -> None:
+        """Init class with esupid, client is http (default) or aiohttpclient."""
 
         if isinstance(activityId, int):
             activityId = str(activityId)
@@ -73,9 +814,18 @@ class extruder:
         self.TemplateId = None
         self.ViewId = None
         self.TaskId = None
+        self.TaskList = None
         self.TaskContent = dict()
+        self.TaskIndex = None
+        self.GridHash = None
+        self.changed = dict()
         self.subscribers = list()
         self.hidden_url = os.environ.get('ESUPPATH')
+        self.scheduler = scheduler
+        self.cache = cache
+        if client is not None and client is not http:
+            self.json_http = client(self.json_http.headers)
+            self.form_http = client(self.form_http.headers)
     
     async def status(self, value: int) -> bool:
         """Check requests status"""
@@ -84,6 +834,14 @@ class extruder:
             return False
         return True
     
+    async def request(self, endpoint: str, func: object, *args, coalesce: bool = True) -> object:
+        """Send request through scheduler, identical requests in flight are coalesced unless they change data"""
+
+        limits = self.scheduler or scheduler.shared()
+        if coalesce:
+            return await limits.once(endpoint, func, *args)
+        return await limits.request(endpoint, func, *args)
+
     async def addsubscriber(self, subscriber: object) -> None:
         """Add new subscriber"""
 
@@ -101,83 +859,220 @@ class extruder:
         return e
 
         
+    def cachedtemplate(self) -> bool:
+        """Take TemplateId and ViewId from cache if they are there"""
+
+        if (self.TemplateId is None or self.ViewId is None) and self.cache is not None:
+            cached = self.cache.get(self.activityId)
+            self.TemplateId = cached.get('TemplateId', None)
+            self.ViewId = cached.get('ViewId', None)
+            hit = not (self.TemplateId is None or self.ViewId is None)
+            metrics.count('esup_cache_hits_total' if hit else 'esup_cache_misses_total', kind='activity')
+        return not (self.TemplateId is None or self.ViewId is None)
+
+    def settemplate(self, TemplateId: object, ViewId: object) -> None:
+        """Remember TemplateId and ViewId of activity"""
+
+        self.TemplateId = TemplateId
+        self.ViewId = ViewId
+        if self.cache is not None:
+            self.cache.put(self.activityId, self.TemplateId, self.ViewId)
+
     async def FindByActivityId(self) -> dict:
         """Find all elements with a given id"""
 
-        if not (self.TemplateId is None or self.ViewId is None):
+        if self.cachedtemplate():
             return await self.event({'func': 'FindByActivityId', 'status': True, 'id': self.activityId})
         
-        headers = {"Content-Type": "application/json, text/javascript, */*; q=0.01"}
         url = f'http://{self.hidden_url}/Activities/FindByActivityId'
         data = str({'activityId': self.activityId})
         
-        r = await asyncio.to_thread(http(headers).post, url, data)
+        r = await self.request('FindByActivityId', self.json_http.post, url, data)
 
-        if await self.status(r.status_code):
+        if r is None or await self.status(r.status_code):
             return await self.event({'func': 'FindByActivityId', 'status': False, 'id': self.activityId})
     
         result = r.json()
-        self.TemplateId = result.get('TemplateId', None)
-        self.ViewId = result.get('ViewId', None)
-
-        if self.TemplateId is None or self.ViewId is None:
+        if result.get('TemplateId', None) is None or result.get('ViewId', None) is None:
             return await self.event({'func': 'FindByActivityId', 'status': False, 'id': self.activityId})
-        
+
+        self.settemplate(result['TemplateId'], result['ViewId'])
         return await self.event({'func': 'FindByActivityId', 'status': True, 'id': self.activityId})
     
-    async def GridRead(self, taskName: str) -> dict:
-        """Method for get all tasks from one item"""
+    @staticmethod
+    def griddata(ids: list, viewId: object, templateId: object, page: int = 1, pageSize: int = 1) -> str:
+        """Form of Grid_Read request filtered by list of activity ids"""
 
-        if self.TaskId is not None:
-            return await self.event({'func': 'GridRead', 'status': True, 'id': self.activityId})
-        
-        headers = {"Content-Type": "application/x-www-form-urlencoded; charset=UTF-8"}
+        data = f"sort=&page={page}&pageSize={pageSize}&group=&filter=ID~gt~'"
+        data += '{"attributeType":"LookUp","mode":0,"value":[{"operator":"IsContainedIn","value":"' + ','.join(map(str, ids)) + '"}]}'
+        data += "'"
+        data += '&viewId=' + str(viewId) + '&myViewId=&templateId=' + str(templateId) + '&workObjectId='
+        return data
 
-        url = f'http://{self.hidden_url}/Activities/Grid_Read'
+    def settasks(self, row: dict) -> None:
+        """Remember all tasks of activity from TaskList columns of grid row and hash of the whole row"""
 
-        data = "sort=&page=1&pageSize=1&group=&filter=ID~gt~'"
-        data += '{"attributeType":"LookUp","mode":0,"value":[{"operator":"IsContainedIn","value":"' + str(self.activityId) + '"}]}'
-        data += "'"
-        data += '&viewId=' + str(self.ViewId) + '&myViewId=&templateId=' + str(self.TemplateId) + '&workObjectId='
-        
-        r = await asyncio.to_thread(http(headers).post, url, data)
+        self.GridHash = hashlib.sha1(json.dumps(row, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+        self.TaskList = dict()
+        for key, val in row.items():
+            if key[:8] == 'TaskList' and isinstance(val, dict):
+                self.TaskList[val["Name"]] = val["ID"]
 
-        if await self.status(r.status_code):
-            return await self.event({'func': 'GridRead', 'status': False, 'id': self.activityId})
-    
-        result = r.json()
+        if self.cache is not None:
+            self.cache.puttasks(self.activityId, self.TaskList)
 
-        for key, val in result["Data"][0].items():
-            if key[:8] == 'TaskList':
-                if val["Name"]==taskName:
-                    self.TaskId = val["ID"]
-                    return await self.event({'func': 'GridRead', 'status': True, 'id': self.activityId})
+    def cachedtask(self, taskName: str) -> bool:
+        """Take TaskId from cache if it is there"""
+
+        if self.TaskId is None and self.cache is not None:
+            self.TaskId = self.cache.task(self.activityId, taskName)
+            metrics.count('esup_cache_misses_total' if self.TaskId is None else 'esup_cache_hits_total', kind='task')
+        return self.TaskId is not None
+
+    async def GridRead(self, taskName: str) -> dict:
+        """Method for get all tasks from one item"""
+
+        if self.cachedtask(taskName):
+            return await self.event({'func': 'GridRead', 'status': True, 'id': self.activityId})
+
+        if self.TaskList is None:
+            url = f'http://{self.hidden_url}/Activities/Grid_Read'
+            data = self.griddata([self.activityId], self.ViewId, self.TemplateId)
+
+            r = await self.request('GridRead', self.form_http.post, url, data)
+
+            if r is None or await self.status(r.status_code):
+                return await self.event({'func': 'GridRead', 'status': False, 'id': self.activityId})
+
+            result = r.json()
+            if not result.get("Data"):
+                return await self.event({'func': 'GridRead', 'status': False, 'id': self.activityId})
+
+            self.settasks(result["Data"][0])
+
+        self.TaskId = self.TaskList.get(taskName, None)
+        return await self.event({'func': 'GridRead', 'status': self.TaskId is not None, 'id': self.activityId})
+
+    def cachedtasks(self) -> bool:
+        """Take all tasks of grid row from cache if they are there"""
+
+        if self.TaskList is None and self.cache is not None:
+            cached = self.cache.tasks(self.activityId)
+            metrics.count('esup_cache_hits_total' if cached else 'esup_cache_misses_total', kind='tasks')
+            self.TaskList = cached or None
+        return self.TaskList is not None
+
+    async def GridTasks(self, taskNames: list) -> dict:
+        """
+        TaskId of every task name from one grid row (or from cache, where all tasks of the row are saved).
+        Tasks absent in activity are left out, status is False only when grid can not be read.
+        """
+
+        if not self.cachedtasks():
+            self.TaskId = None
+            await self.GridRead(taskNames[0])
+            if self.TaskList is None:
+                return await self.event({'func': 'GridTasks', 'status': False, 'id': self.activityId})
+
+        found = {name: self.TaskList[name] for name in taskNames if name in self.TaskList}
+        return await self.event({'func': 'GridTasks', 'status': True, 'value': found, 'id': self.activityId})
+
+    @classmethod
+    async def GridReadBatch(cls, items: list, taskName: str, batch: int = 200, fresh: bool = False) -> None:
+        """
+        Resolve TaskId for many activities: one Grid_Read request per batch of ids with the same view and template.
+        Activities which are not found in grid are left for GridRead. Fresh reads grid even for cached tasks.
+        """
+
+        groups = dict()
+        for item in items:
+            if item.TaskList is not None or (not fresh and item.cachedtask(taskName)):
+                continue
+            if not (item.TemplateId is None or item.ViewId is None):
+                groups.setdefault((item.ViewId, item.TemplateId), dict())[str(item.activityId)] = item
+
+        jobs = list()
+        for (viewId, templateId), group in groups.items():
+            ids = list(group)
+            for start in range(0, len(ids), batch):
+                chunk = {k: group[k] for k in ids[start:start + batch]}
+                jobs.append(cls.gridchunk(chunk, viewId, templateId, taskName, batch))
+
+        start = time.monotonic()
+        await asyncio.gather(*jobs)
+        metrics.observe('esup_stage_seconds', time.monotonic() - start, stage='GridReadBatch')
+
+    @classmethod
+    async def GridReadProbe(cls, items: list, viewId: object, templateId: object, taskName: str, batch: int = 200) -> int:
+        """Look for activities without template in grid of known view and template, returns count of found ones"""
+
+        group = {str(item.activityId): item for item in items}
+        ids = list(group)
+        chunks = [{k: group[k] for k in ids[start:start + batch]} for start in range(0, len(ids), batch)]
+        found = await asyncio.gather(*(cls.gridchunk(chunk, viewId, templateId, taskName, batch) for chunk in chunks))
+        metrics.count('esup_template_probes_total', len(chunks))
+        return sum(found)
+
+    @staticmethod
+    async def gridchunk(chunk: dict, viewId: object, templateId: object, taskName: str, pageSize: int) -> int:
+        """
+        Read all pages of grid for one batch of ids, returns count of found activities.
+        Activities without template yet get view and template of grid where they are found.
+        """
+
+        first = next(iter(chunk.values()))
+        url = f'http://{first.hidden_url}/Activities/Grid_Read'
+        page, found = 1, 0
+
+        while found < len(chunk):
+            data = first.griddata(list(chunk), viewId, templateId, page, pageSize)
+            r = await first.request('GridRead', first.form_http.post, url, data)
+            if r is None or await first.status(r.status_code):
+                return found
+
+            result = r.json()
+            rows = result.get("Data") or list()
+            for row in rows:
+                item = chunk.get(str(row.get("ID")))
+                if item is None:
+                    continue
+                if item.TemplateId is None or item.ViewId is None:
+                    item.settemplate(templateId, viewId)
+                item.settasks(row)
+                item.TaskId = item.TaskList.get(taskName, None)
+                await item.event({'func': 'GridRead', 'status': item.TaskId is not None, 'id': item.activityId})
+                found += 1
+
+            if not rows or page * pageSize >= result.get("Total", 0):
+                return found
+            page += 1
+        return found
+
+    async def taskpage(self, taskId: object) -> dict:
+        """Task page by id or None, activity is not changed, so pages of several tasks may be loaded at once"""
+
+        url = f'http://{self.hidden_url}/EsupTask?taskId=' + str(taskId)
+
+        r = await self.request('EsupTask', self.form_http.scan, url, itemscanner)
+
+        if r is None or await self.status(r.status_code):
+            return None
+        return r.item if isinstance(r.item, dict) else None
 
-        return await self.event({'func': 'GridRead', 'status': False, 'id': self.activityId})
-    
     async def EsupTask(self) -> dict:
         """Loads task page by TaskId"""
 
         if self.TaskId is None:
             return {'func': 'EsupTask', 'status': False, 'id': self.activityId}
         
-        headers = {"Content-Type": "application/x-www-form-urlencoded; charset=UTF-8"}
-        url = f'http://{self.hidden_url}/EsupTask?taskId=' + str(self.TaskId)
-
-        r = await asyncio.to_thread(http(headers).get, url)
-
-        if await self.status(r.status_code):
+        page = await self.taskpage(self.TaskId)
+        if page is None:
             return await self.event({'func': 'EsupTask', 'status': False, 'id': self.activityId})
-        
-        html = r.content.decode('utf-8')
 
-        p = re.compile(r'kendo.observable\({\ *Item\ *:\ *({.*})}\);')
-        m = p.search(html)
-        if m:
-            self.TaskContent = json.loads(m.group(1))
-            return await self.event({'func': 'EsupTask', 'status': True, 'id': self.activityId})
-        
-        return await self.event({'func': 'EsupTask', 'status': False, 'id': self.activityId})
+        self.TaskContent = page
+        self.TaskIndex = None
+        self.changed = dict()
+        return await self.event({'func': 'EsupTask', 'status': True, 'id': self.activityId})
     
     async def pipeline(self, line: list) -> dict:
         """Prepare data via pipeline"""
@@ -186,10 +1081,12 @@ class extruder:
         for k, v in line.items():
             method = getattr(self, k, None)
             if method:
+                start = time.monotonic()
                 if v:
                     result = await method(v)
                 else:
                     result = await method()
+                metrics.observe('esup_stage_seconds', time.monotonic() - start, stage=k)
 
                 if isinstance(result, dict):
 
@@ -203,130 +1100,672 @@ class extruder:
 
         return await self.event(result)
         
+    def index(self) -> dict:
+        """Parameters of loaded task by name, built once per page"""
+
+        if self.TaskIndex is None:
+            self.TaskIndex = {val["Name"]: val for val in self.TaskContent.get('Parameters') or list()}
+        return self.TaskIndex
+
+    def lookup(self, parametr_name: str) -> tuple:
+        """Is parameter present in loaded context and its value"""
+
+        if self.TaskContent.get(parametr_name, False):
+            return True, self.TaskContent[parametr_name]
+
+        val = self.index().get(parametr_name, None)
+        if val is None:
+            return False, None
+        return True, val["Value"]
+
     async def getValue(self, parametr_name: str) -> dict:
         """Get value by name from loaded context"""
         if not isinstance(self.TaskContent, dict):
             return await self.event({'func': 'getValue', 'status': False, 'id': self.activityId})
 
-        if self.TaskContent.get(parametr_name, False):
-            return await self.event({'func': 'getValue', 'status': True, 'value': [self.activityId, self.TaskContent[parametr_name]], 'id': self.activityId})
-        
-        for val in self.TaskContent['Parameters']:
-            if val["Name"] == parametr_name:
-                return await self.event({'func': 'getValue', 'status': True, 'value': [self.activityId, val["Value"]], 'id': self.activityId})
+        found, value = self.lookup(parametr_name)
+        if found:
+            return await self.event({'func': 'getValue', 'status': True, 'value': [self.activityId, value], 'id': self.activityId})
         
         return await self.event({'func': 'getValue', 'status': False, 'id': self.activityId})
+
+    async def getValues(self, parametr_names: list) -> dict:
+        """Get values of several parameters from one loaded context, missing ones are None"""
+
+        if not isinstance(self.TaskContent, dict):
+            return await self.event({'func': 'getValues', 'status': False, 'id': self.activityId})
+
+        values = dict()
+        for name in parametr_names:
+            found, value = self.lookup(name)
+            if found:
+                values[name] = value
+
+        if not values:
+            return await self.event({'func': 'getValues', 'status': False, 'id': self.activityId})
+
+        return await self.event({'func': 'getValues', 'status': True, 'value': [self.activityId, values], 'id': self.activityId})
     
+    @staticmethod
+    def same(old: object, new: object) -> bool:
+        """Compare value from esup with value from spreadsheet, dates are compared as timestamps"""
+
+        if isinstance(old, str) and old.startswith('/Date('):
+            return edate(old).ts == edate(new).ts
+        if old in (None, '') or new in (None, ''):
+            return old in (None, '') and new in (None, '')
+        return str(old) == str(new)
+
+    @staticmethod
+    def esupvalue(old: object, new: object) -> object:
+        """New value in format of esup, dates become /Date(ms)/, None if date is expected and new is not a date"""
+
+        if isinstance(new, datetime.datetime) or (isinstance(old, str) and old.startswith('/Date(')):
+            new = edate(new)
+            return None if new.ts is None else new.timestamp()
+        return new
+
     async def setValue(self, parametr_name: str, newValue: object) -> dict:
-        """Set value by name to loaded context"""
+        """Set value by name to loaded context, changed parameters are remembered for saveValues"""
 
         if not isinstance(self.TaskContent, dict):
             return await self.event({'func': 'setValue', 'status': False, 'id': self.activityId})
-        
-        if self.TaskContent.get(parametr_name, False):
-            self.TaskContent[parametr_name] = newValue
-        
-        for val in self.TaskContent['Parameters']:
-            if val["Name"] == parametr_name:
+
+        found, value = self.lookup(parametr_name)
+        if not found:
+            return await self.event({'func': 'setValue', 'status': False, 'id': self.activityId})
+
+        if not self.same(value, newValue):
+            esup = self.esupvalue(value, newValue)
+            if esup is None:
+                # unparsed date must never reach esup
+                return await self.event({'func': 'setValue', 'status': False, 'id': self.activityId,
+                                         'error': f'{parametr_name}: {newValue!r} is not a date'})
+            newValue = esup
+            self.changed[parametr_name] = [value, newValue]
+            if self.TaskContent.get(parametr_name, False):
+                self.TaskContent[parametr_name] = newValue
+            val = self.index().get(parametr_name, None)
+            if val is not None:
                 val["Value"] = newValue
         
-        return await self.event({'func': 'setValue', 'status': False, 'id': self.activityId})
+        return await self.event({'func': 'setValue', 'status': True, 'id': self.activityId})
+
+    async def setValues(self, values: dict) -> dict:
+        """Set several values by name, status is False if some parameter is absent in task"""
+
+        for name, newValue in values.items():
+            result = await self.setValue(name, newValue)
+            if not result['status']:
+                return await self.event({'func': 'setValues', 'status': False, 'id': self.activityId,
+                                         'error': result.get('error', f'{name}: no such parameter in task')})
+
+        return await self.event({'func': 'setValues', 'status': True, 'value': [self.activityId, dict(self.changed)], 'id': self.activityId})
+
+    async def saveValues(self) -> dict:
+        """Send changed parameters of loaded task to esup, nothing is sent when nothing changed"""
+
+        if not self.changed:
+            return await self.event({'func': 'saveValues', 'status': True, 'value': [self.activityId, dict()], 'id': self.activityId})
+
+        url = f'http://{self.hidden_url}/{SAVE_METHOD}'
+        index = self.index()
+        parameters = [index[name] if name in index else {'Name': name, 'Value': self.TaskContent[name]} for name in self.changed]
+        data = json.dumps({'taskId': self.TaskId, 'Parameters': parameters}, ensure_ascii=False).encode('utf-8')
+
+        r = await self.request('saveValues', self.json_http.post, url, data, coalesce=False)
+
+        if r is None or await self.status(r.status_code):
+            return await self.event({'func': 'saveValues', 'status': False, 'id': self.activityId})
+
+        changed = dict(self.changed)
+        self.changed.clear()
+        return await self.event({'func': 'saveValues', 'status': True, 'value': [self.activityId, changed], 'id': self.activityId})
     
     def clear(self) -> None:
-        """Clear rubish for pickle"""
+        """Free loaded page and subscribers"""
         self.TaskContent = None
+        self.TaskIndex = None
         self.subscribers = list()
     
     def __hash__(self) -> int:
         """ActivityID must be unique"""
-        return self.activityId
+        return hash(self.activityId)
     
+class taskgraph:
+    """
+    Pipelines from config file run as small DAG for every activity: grid row is read once for all tasks,
+    every distinct task page is loaded once, then values of every pipeline are taken from its page.
+    Pipeline runs after pipelines listed in its after and is skipped if one of them failed.
+
+    {"pipelines": [{"name": "ready", "task": "Готовность к работам по БС", "params": ["Дата готовности к работам по БС"]},
+                   {"name": "approve", "task": "Согласование проекта", "params": ["Дата согласования"], "after": ["ready"]}]}
+    """
+
+    def __init__(self, pipelines: list) -> None:
+        self.pipelines = list()
+        for val in pipelines:
+            if not val.get('task') or not val.get('params'):
+                raise ValueError(f'Pipeline needs task and params: {val}')
+            params = [val['params']] if isinstance(val['params'], str) else list(val['params'])
+            self.pipelines.append({'name': val.get('name') or val['task'], 'task': val['task'],
+                                   'params': params, 'after': list(val.get('after') or list())})
+
+        names = [val['name'] for val in self.pipelines]
+        if len(set(names)) != len(names):
+            raise ValueError('Names of pipelines must be unique')
+        for val in self.pipelines:
+            unknown = [name for name in val['after'] if name not in names]
+            if unknown:
+                raise ValueError(f'Pipeline {val["name"]} is after unknown pipelines: {", ".join(unknown)}')
+
+        self.order = self.sort(self.pipelines)
+        self.tasks = list(dict.fromkeys(val['task'] for val in self.pipelines))
+
+    @staticmethod
+    def sort(pipelines: list) -> list:
+        """Pipelines in order where every one goes after its dependencies"""
+
+        order, done, left = list(), set(), list(pipelines)
+        while left:
+            ready = [val for val in left if all(name in done for name in val['after'])]
+            if not ready:
+                raise ValueError('Pipelines have cycle: ' + ', '.join(val['name'] for val in left))
+            for val in ready:
+                order.append(val)
+                done.add(val['name'])
+                left.remove(val)
+        return order
+
+    @classmethod
+    def load(cls, path: str) -> 'taskgraph':
+        """Read config, it is a list of pipelines or an object with pipelines key"""
+
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(config['pipelines'] if isinstance(config, dict) else config)
+
+    @staticmethod
+    def column(name: str, param: str) -> str:
+        return f'{name}: {param}'
+
+    def columns(self) -> list:
+        """Columns of result, one per parameter of every pipeline"""
+
+        return [self.column(val['name'], param) for val in self.pipelines for param in val['params']]
+
+    def key(self) -> str:
+        """Name of graph in state of delta sync, other pipelines or parameters start their own state"""
+
+        return ' + '.join(sorted(f'{val["name"]}: {val["task"]}: {", ".join(sorted(val["params"]))}'
+                                 for val in self.pipelines))
+
+    async def run(self, item: extruder) -> dict:
+        """
+        Run all pipelines for one activity. Status is False when activity, grid or some page can not be loaded,
+        so the row is tried again on next run. Values of tasks absent in activity stay empty.
+        """
+
+        start = time.monotonic()
+        fail = {'func': 'taskgraph', 'status': False, 'id': item.activityId}
+
+        if not (await item.FindByActivityId())['status']:
+            return await item.event(fail)
+        found = await item.GridTasks(self.tasks)
+        if not found['status']:
+            return await item.event(fail)
+
+        # pipelines go by levels, pages of all pipelines whose dependencies are finished are loaded at once
+        pages, values, failed, finished, left = dict(), dict(), set(), set(), list(self.order)
+        while left:
+            ready = [val for val in left if all(name in finished for name in val['after'])]
+            for val in ready:
+                if val['task'] not in found['value'] or any(name in failed for name in val['after']):
+                    failed.add(val['name'])
+
+            tasks = list(dict.fromkeys(val['task'] for val in ready if val['name'] not in failed and val['task'] not in pages))
+            loaded = await asyncio.gather(*(item.taskpage(found['value'][task]) for task in tasks))
+            for task, page in zip(tasks, loaded):
+                await item.event({'func': 'EsupTask', 'status': page is not None, 'id': item.activityId})
+                if page is None:
+                    return await item.event(fail)
+                pages[task] = page
+
+            for val in ready:
+                left.remove(val)
+                finished.add(val['name'])
+                if val['name'] in failed:
+                    continue
+                item.TaskContent, item.TaskIndex = pages[val['task']], None
+                result = await item.getValues(val['params'])
+                if not result['status']:
+                    failed.add(val['name'])
+                    continue
+                for param, value in result['value'][1].items():
+                    values[self.column(val['name'], param)] = value
+
+        metrics.observe('esup_stage_seconds', time.monotonic() - start, stage='taskgraph')
+        return await item.event({'func': 'taskgraph', 'status': True, 'value': [item.activityId, values], 'id': item.activityId})
+
+
 class edate:
     """Class for handling esup dates, it represent in timestamp format."""
 
+    __slots__ = ('ts',)
+
+    pattern = re.compile(r'/Date\((-?[0-9]+)(?:[+-][0-9]{4})?\)/')
+
     def __init__(self, timestamp: any) -> None:
         self.ts = None
 
-        if isinstance(timestamp, str):
-            
+        if isinstance(timestamp, edate):
+            self.ts = timestamp.ts
+        elif isinstance(timestamp, str):
             if timestamp.isdigit():
                 self.ts = int(timestamp)
             else:
-                p = re.compile(r'/Date\(([0-9]{13})\)/')
-                m = p.search(timestamp)
+                m = self.pattern.search(timestamp)
                 if m:
-                    timestamp = m.group(1)
-                    self.ts = int(timestamp)
-
-        if isinstance(timestamp, int):
+                    self.ts = int(m.group(1))
+        elif isinstance(timestamp, datetime.datetime):
+            self.ts = int(timestamp.timestamp() * 1000)
+        elif isinstance(timestamp, int) and not isinstance(timestamp, bool):
             self.ts = timestamp
-    
+
+    @staticmethod
+    def of(other: object) -> object:
+        """Timestamp of other side of comparison"""
+
+        return other.ts if isinstance(other, edate) else edate(other).ts
+
     def __eq__(self, other) -> bool:
-        if isinstance(other, str):
-            other = edate(other)
-        return (self.ts == other.ts)
-    
+        return self.ts == self.of(other)
+
     def __ne__(self, other) -> bool:
-        if isinstance(other, str):
-            other = edate(other)
-        return (self.ts != other.ts)
-    
+        return self.ts != self.of(other)
+
     def __lt__(self, other) -> bool:
-        if isinstance(other, str):
-            other = edate(other)
-        return (self.ts < other.ts)
-     
+        return self.ts < self.of(other)
+
     def __le__(self, other) -> bool:
-        if isinstance(other, str):
-            other = edate(other)
-        return (self.ts <= other.ts)
-       
+        return self.ts <= self.of(other)
+
     def __gt__(self, other) -> bool:
-        if isinstance(other, str):
-            other = edate(other)
-        return (self.ts > other.ts)
-    
+        return self.ts > self.of(other)
+
     def __ge__(self, other) -> bool:
-        if isinstance(other, str):
-            other = edate(other)
-        return (self.ts >= other.ts)
-    
-    def datetime(self) -> datetime:
-        return datetime.datetime.fromtimestamp(self.ts/1000) if not self.ts is None else datetime.datetime(2000, 1, 1)
-        
+        return self.ts >= self.of(other)
+
+    def __hash__(self) -> int:
+        return hash(self.ts)
+
+    def datetime(self, tz: str = None) -> datetime:
+        """Naive local time like before or aware time in tz"""
+
+        if self.ts is None:
+            return datetime.datetime(2000, 1, 1)
+        if tz is None:
+            return datetime.datetime.fromtimestamp(self.ts / 1000)
+        import pandas as pd
+        return pd.Timestamp(self.ts, unit='ms', tz='UTC').tz_convert(tz).to_pydatetime()
+
     def timestamp(self) -> str:
         return (f'/Date({self.ts})/')
 
+    @staticmethod
+    def value(val: object, tz: str = None) -> object:
+        """Datetime for esup date strings, other values as they are"""
+
+        if isinstance(val, str) and val.startswith('/Date('):
+            return edate(val).datetime(tz)
+        return val
+
+    @classmethod
+    def column(cls, values: object, tz: str = None) -> 'pd.Series':
+        """
+        Vectorized edate for whole array: /Date(ms)/ strings, digit strings, ints and datetimes to datetime64 in one pass.
+        Milliseconds are UTC and converted to tz, without tz result is naive local time as edate.datetime() gives.
+        Values which are not dates become NaT.
+        """
+
+        import pandas as pd
+
+        s = values.astype(object) if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+        text = s.astype('string').str.strip()
+        wrapped = (text.str.startswith('/Date(') & text.str.endswith(')/')).fillna(False)
+        inner = text.str.slice(6, -2).where(wrapped, text)
+        digits = inner.str.isdigit().fillna(False)
+
+        ms = pd.Series(float('nan'), index=s.index)
+        ms[digits] = inner[digits].astype('int64')
+        # dates with offset like /Date(1700000000000+0300)/ or before 1970 go through regex
+        rest = wrapped & ~digits
+        if rest.any():
+            ms[rest] = pd.to_numeric(text[rest].str.extract(cls.pattern, expand=False), errors='coerce')
+
+        other = s[ms.isna() & s.notna()]
+        stamps = other[other.map(lambda v: isinstance(v, datetime.datetime))]
+        if len(stamps):
+            ms[stamps.index] = [edate(v).ts for v in stamps]
+
+        if tz is not None:
+            return pd.to_datetime(ms, unit='ms', utc=True).dt.tz_convert(tz)
+
+        # offset of local time is asked once per hour of data, not once per value
+        hours = ms // 3600000
+        offsets = {h: datetime.datetime.fromtimestamp(h * 3600).astimezone().utcoffset() for h in hours.dropna().unique()}
+        return pd.to_datetime(ms, unit='ms') + pd.to_timedelta(hours.map(offsets))
+
+    @classmethod
+    def frame(cls, df: 'pd.DataFrame', tz: str = None) -> 'pd.DataFrame':
+        """Convert esup dates in every column of frame, columns of dates and empty cells become datetime64"""
+
+        import pandas as pd
+
+        for name in df.columns:
+            if not (pd.api.types.is_object_dtype(df[name]) or pd.api.types.is_string_dtype(df[name])):
+                continue
+            dates = df[name].astype('string').str.startswith('/Date(').fillna(False)
+            if not dates.any():
+                continue
+            if (dates | df[name].isna()).all():
+                df[name] = cls.column(df[name], tz)
+            else:
+                df[name] = df[name].map(lambda v: cls.value(v, tz))
+        return df
+
+
+class resultwriter:
+    """
+    Writes results to disk while pipelines finish, csv or parquet (row group per batch), one column per parameter.
+    Every result is appended to checkpoint log at once, output is rebuilt from the log on open,
+    so next run skips activities which already succeeded and nothing is lost on crash.
+    """
+
+    def __init__(self, path: str, params: list, batch: int = 1000, resume: bool = True, tz: str = None) -> None:
+        self.path = path
+        self.tz = tz
+        self.params = list(params)
+        self.columns = ['esupid'] + self.params
+        self.parquet = os.path.splitext(path)[1].lower() in ('.parquet', '.pq')
+        self.checkpoint = path + '.checkpoint'
+        self.batch = batch
+        self.rows = list()
+        self.done = set()
+        self.count = 0
+        self.output = None
+        self.writer = None
+
+        if not resume and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+        if not self.parquet:
+            self.output = open(path, 'w', newline='', encoding='utf-8')
+
+        if os.path.exists(self.checkpoint):
+            with open(self.checkpoint, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        rec = json.loads(line)
+                        # activities saved with other parameters are loaded again
+                        if isinstance(rec['value'], dict) and all(p in rec['value'] for p in self.params):
+                            self.add(rec['id'], rec['value'])
+        self.log = open(self.checkpoint, 'a', encoding='utf-8')
+
+    def add(self, activityId: str, value: dict) -> bool:
+        """Add row to next batch, duplicates are skipped"""
+
+        if activityId in self.done:
+            return False
+        self.done.add(activityId)
+        self.rows.append((activityId, value))
+        if len(self.rows) >= self.batch:
+            self.flush()
+        return True
+
+    def write(self, activityId: str, value: dict) -> None:
+        """Write result of one activity, parameters missing in task are saved as None"""
+
+        value = {p: value.get(p, None) for p in self.params}
+        if self.add(activityId, value):
+            self.log.write(json.dumps({'id': activityId, 'value': value}, ensure_ascii=False) + '\n')
+            self.log.flush()
+
+    def flush(self) -> None:
+        """Write collected batch to output"""
+
+        if not self.rows:
+            return
+
+        import pandas as pd
+
+        # object dtype keeps values as esup gave them, 1 and None do not become 1.0 and NaN
+        df = pd.DataFrame([[k] + [v[p] for p in self.params] for k, v in self.rows], columns=self.columns,
+                          index=range(self.count, self.count + len(self.rows)), dtype=object)
+        edate.frame(df, self.tz)
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, self.schema(df))
+            table = pa.Table.from_pandas(self.conform(df), schema=self.writer.schema, preserve_index=False)
+            self.writer.write_table(table)
+        else:
+            df.to_csv(self.output, header=self.count == 0)
+            self.output.flush()
+
+        self.count += len(self.rows)
+        self.rows.clear()
+
+    def schema(self, df: 'pd.DataFrame') -> 'pa.Schema':
+        """
+        Schema of parquet for all batches, fixed by the first one: columns of dates are timestamps, the rest are strings,
+        so a column which is empty or has other types in the first batch does not break later ones
+        """
+
+        import pandas as pd
+        import pyarrow as pa
+
+        return pa.schema([(c, pa.timestamp('us', tz=self.tz) if pd.api.types.is_datetime64_any_dtype(df[c]) else pa.string())
+                          for c in self.columns])
+
+    def conform(self, df: 'pd.DataFrame') -> 'pd.DataFrame':
+        """Batch converted to types of schema, values which are not dates become empty in columns of dates"""
+
+        import pandas as pd
+        import pyarrow as pa
+
+        for field in self.writer.schema:
+            column = df[field.name]
+            if pa.types.is_timestamp(field.type):
+                if not pd.api.types.is_datetime64_any_dtype(column):
+                    df[field.name] = edate.column(column, self.tz)
+            else:
+                df[field.name] = column.astype(object).map(lambda v: None if v is None or v is pd.NaT or v != v else str(v))
+        return df
+
+    def close(self) -> None:
+        """Flush rest of rows and close files"""
+
+        self.flush()
+        if self.output is not None and self.count == 0:
+            import pandas as pd
+
+            pd.DataFrame(columns=self.columns).to_csv(self.output)
+        if self.writer is not None:
+            self.writer.close()
+        elif self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            pq.write_table(pa.table({c: pa.array([], pa.string()) for c in self.columns}), self.path)
+        if self.output is not None:
+            self.output.close()
+        self.log.close()
+
+class workbooks:
+    """
+    Cache of read workbooks with LRU eviction, keys are path, mtime and sheet, so changed file is read again.
+    xlsx files are streamed in read-only mode and only needed cells are kept, other formats go through pandas.
+    """
+
+    size = 32
+    _cache = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def cached(cls, key: tuple, loader: object) -> object:
+        """Value from cache or from loader"""
+
+        with cls._lock:
+            if key in cls._cache:
+                cls._cache.move_to_end(key)
+                return cls._cache[key]
+
+        value = loader()
+        with cls._lock:
+            cls._cache[key] = value
+            while len(cls._cache) > cls.size:
+                cls._cache.popitem(last=False)
+        return value
+
+    @staticmethod
+    def key(path: str, *args) -> tuple:
+        """Key of cache, raises FileNotFoundError for missing file"""
+
+        return (os.path.abspath(path), os.path.getmtime(path)) + args
+
+    @staticmethod
+    def streamed(path: str) -> bool:
+        """Can file be read by openpyxl"""
+
+        return os.path.splitext(path)[1].lower() in ('.xlsx', '.xlsm')
+
+    @classmethod
+    def sheets(cls, path: str) -> list:
+        """Names of sheets"""
+
+        def load():
+            if cls.streamed(path):
+                import openpyxl
+                book = openpyxl.load_workbook(path, read_only=True)
+                names = list(book.sheetnames)
+                book.close()
+                return names
+            import pandas as pd
+            return pd.ExcelFile(path).sheet_names
+
+        return cls.cached(cls.key(path, 'sheets'), load)
+
+    @classmethod
+    def rows(cls, path: str, sheet: int, columns: list = None, limit: int = None) -> object:
+        """Generator of rows (header is the first one) with values of given columns only"""
+
+        if not cls.streamed(path):
+            import pandas as pd
+            df = pd.ExcelFile(path).parse(sheet, header=None, nrows=limit)
+            if columns is not None:
+                df = df[columns]
+            df = df.astype(object).where(df.notna(), None)
+            yield from df.itertuples(index=False, name=None)
+            return
+
+        import openpyxl
+        book = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        first = 0 if columns is None else min(columns)
+        last = None if columns is None else max(columns) + 1
+        try:
+            for row in book.worksheets[sheet].iter_rows(min_col=first + 1, max_col=last, max_row=limit, values_only=True):
+                if columns is None:
+                    yield row
+                else:
+                    yield tuple(row[c - first] if c - first < len(row) else None for c in columns)
+        finally:
+            book.close()
+
+    @classmethod
+    def column(cls, path: str, sheet: int, col: int) -> list:
+        """Values of one column without header and empty cells"""
+
+        def load():
+            rows = cls.rows(path, sheet, [col])
+            next(rows, None)
+            return [row[0] for row in rows if row and row[0] is not None]
+
+        return cls.cached(cls.key(path, sheet, 'column', col), load)
+
+    @classmethod
+    def preview(cls, path: str, sheet: int, count: int = 5) -> tuple:
+        """Header and first rows of sheet"""
+
+        def load():
+            rows = list(cls.rows(path, sheet, limit=count + 1))
+            if not rows:
+                return list(), list()
+            header = ['' if v is None else v for v in rows[0]]
+            return header, rows[1:]
+
+        return cls.cached(cls.key(path, sheet, 'preview', count), load)
+
 
 class webmethods:
     """Implements web interface when cli options so hard"""
 
-    def __init__(self, data):
+    def __init__(self, data, backlog: int = 10000, queue: int = 5000, batch: int = 500,
+                 interval: float = 0.1, timeout: float = 5.0, page: int = 1000):
         
         self.html = zlib.decompress(base64.b64decode(data)).decode()
         #with open('D:/source/tst01/fromfile.html', 'r') as f:
         #    self.html = f.read()
-        self.mainstream = list()
+        self.mainstream = deque(maxlen=backlog)
+        self.ids = list()
+        self.page = page
+        self.clients = set()
+        self.queue = queue
+        self.chunk = batch
+        self.interval = interval
+        self.timeout = timeout
     
     async def event(self, val: dict) -> dict:
-        """Append event message to list"""
+        """Append event message to list and push it to every connected browser"""
+
+        await self.batch([val])
+
+    async def batch(self, vals: list) -> None:
+        """Append batch of event messages to list and push them to every connected browser"""
 
-        self.mainstream.append(val)
+        self.mainstream.extend(vals)
+
+        for client in list(self.clients):
+            for val in vals:
+                try:
+                    client.put_nowait(val)
+                except asyncio.QueueFull:
+                    # backpressure: wait a little for slow browser, then forget it
+                    try:
+                        await asyncio.wait_for(client.put(val), self.timeout)
+                    except asyncio.TimeoutError:
+                        self.clients.discard(client)
+                        break
 
     async def index(self, request: object) -> None:
         """Main page. Offers to select a file to upload"""
 
+        from aiohttp import web
+
         return web.Response(text = self.html, content_type='text/html')
 
     async def fileupload(self, request: object) -> None:
         """Main page. Show sheets of excel file, offers to select one."""
 
+        from aiohttp import web
+
         dataset = request.rel_url.query['dataset'].replace("\\", "/")
         try:
-            xl = pd.ExcelFile(dataset)
-            context = ''
-            for idx in range(len(xl.sheet_names)):
-                context += f'<div class="xl-sheets" onclick="javascript: window.location.replace(\'/tableopen?dataset={dataset}&sheet={idx}\')">{xl.sheet_names[idx]}</div>'
+            sheet_names = await asyncio.to_thread(workbooks.sheets, dataset)
+            context = ''.join(f'<div class="xl-sheets" onclick="javascript: window.location.replace(\'/tableopen?dataset={dataset}&sheet={idx}\')">{name}</div>'
+                              for idx, name in enumerate(sheet_names))
             self.sheets = context
             
         except FileNotFoundError:
@@ -336,22 +1775,22 @@ class webmethods:
         return web.Response(text = html, content_type='text/html')
 
     async def tableopen(self, request: object) -> None:
+        from aiohttp import web
+
         dataset = request.rel_url.query['dataset']
         sheet_num = request.rel_url.query['sheet']
 
         if sheet_num.isdigit():
             try:
-                xl = pd.ExcelFile(dataset)
-                df = xl.parse(xl.sheet_names[int(sheet_num)])
-                context = '<table><tr>'
-                for idx, col in enumerate(df.columns):
-                    context += f'<th class="xl-column" onclick="setcol(event, {idx})" id="col{idx}">{col}</th>'
-                for rows in df.values[:5]:
-                    context += '</tr><tr>'
-                    for row in rows:
-                        context += f'<td>{row}</td>'        
-                context += '</tr>'
-                context += '</table>'
+                header, preview = await asyncio.to_thread(workbooks.preview, dataset, int(sheet_num))
+                context = ['<table><tr>']
+                for idx, col in enumerate(header):
+                    context.append(f'<th class="xl-column" onclick="setcol(event, {idx})" id="col{idx}">{col}</th>')
+                for rows in preview:
+                    context.append('</tr><tr>')
+                    context.extend(f'<td>{row}</td>' for row in rows)
+                context.append('</tr></table>')
+                context = ''.join(context)
                 self.table = context
 
             except FileNotFoundError:
@@ -363,112 +1802,665 @@ class webmethods:
 
     async def dataload(self, request: object) -> None:
         """This method makes items at main window and launch update javascript."""
+
+        from aiohttp import web
+
         dataset = request.rel_url.query['dataset']
         sheet_num = request.rel_url.query['sheet']
         id_col = request.rel_url.query['idcolumn']
+        task_name = request.rel_url.query.get('task', '').strip() or DEFAULT_TASK
+        params = [p.strip() for p in request.rel_url.query.get('params', '').split(';') if p.strip()] or [DEFAULT_PARAM]
 
         if sheet_num.isdigit():
-            xl = pd.ExcelFile(dataset)
-            df = xl.parse(xl.sheet_names[int(sheet_num)])
             if id_col.isdigit():
-                df = df[df.columns[int(id_col)]]
-                context = ''
-                for val in df:
-                    context += f'<div class="items" id="i{val}">{val}</div>'
+                self.ids = await asyncio.to_thread(workbooks.column, dataset, int(sheet_num), int(id_col))
+                context = self.itemshtml(0, self.page)
             self.items = context
-            context += '<script>window.onload = update</script>'
-            asyncio.create_task(main(dataset, 0, int(sheet_num), int(id_col), self))
+            self.mainstream.clear()
+            context += f'<script>items_offset = {min(self.page, len(self.ids))}; items_total = {len(self.ids)}; window.onload = listen</script>'
+            # page waits for every listed id, so reload always loads all of them instead of resuming
+            asyncio.create_task(main(dataset, 0, int(sheet_num), int(id_col), self, resume=False,
+                                     task_name=task_name, params=params, ids=self.ids))
 
             html = self.html.replace('<!--items-->', context, 1).replace('<!--dataset-->', dataset, 1).replace('<!--sheet-->', sheet_num, 1)
     
         return web.Response(text = html, content_type='text/html')
     
+    def itemshtml(self, offset: int, limit: int) -> str:
+        """Items of loaded ids from offset"""
+
+        return ''.join(f'<div class="items" id="i{val}">{val}</div>' for val in self.ids[offset:offset + limit])
+
+    async def itemspage(self, request: object) -> None:
+        """Next page of items, browser asks for it while scrolling, so big sheets are not rendered at once."""
+
+        from aiohttp import web
+
+        offset = request.rel_url.query.get('offset', '0')
+        limit = request.rel_url.query.get('limit', str(self.page))
+        if not (offset.isdigit() and limit.isdigit()):
+            return web.Response(text = '', content_type='text/html')
+
+        return web.Response(text = self.itemshtml(int(offset), min(int(limit), self.page)), content_type='text/html')
+
+    async def events(self, request: object) -> None:
+        """Server-sent events: batches of event messages as soon as data loaded."""
+
+        from aiohttp import web
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+
+        client = asyncio.Queue(self.queue)
+        for val in list(self.mainstream)[-self.queue:]:
+            client.put_nowait(val)
+        self.clients.add(client)
+
+        try:
+            while client in self.clients:
+                try:
+                    batch = [await asyncio.wait_for(client.get(), 15)]
+                except asyncio.TimeoutError:
+                    await response.write(b': ping\n\n')
+                    continue
+
+                # coalesce events coming close to each other into one message
+                await asyncio.sleep(self.interval)
+                while len(batch) < self.chunk and not client.empty():
+                    batch.append(client.get_nowait())
+
+                await response.write(b'data: ' + json.dumps(batch).encode() + b'\n\n')
+                if any(val.get('func') == 'main' for val in batch):
+                    break
+        except ConnectionResetError:
+            pass
+        finally:
+            self.clients.discard(client)
+
+        return response
+
+    async def metricspage(self, request: object) -> None:
+        """Metrics of all downloads in Prometheus text format."""
+
+        from aiohttp import web
+
+        return web.Response(text = metrics.prometheus(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
     async def update(self, request: object) -> None:
         """This method sends jsons to browser as soon as data loaded then flushing list."""
 
-        result = json.dumps(self.mainstream)
+        from aiohttp import web
+
+        result = json.dumps(list(self.mainstream))
         self.mainstream.clear()
         return web.Response(text = result, content_type='application/json')
 
 class consoler:
-    """One more subscriber for print progress to console"""
+    """One more subscriber for print aggregated progress to console not more often than interval"""
+
+    def __init__(self, interval: float = 1.0, stream: object = None, prefix: str = '') -> None:
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.prefix = prefix
+        self.stages = dict()
+        self.rows = 0
+        self.errors = 0
+        self.dropped = 0
+        self.start = time.monotonic()
+        self.shown = 0.0
+
     async def event(self, val):
-        print(val)
-    
+        await self.batch([val])
+
+    async def batch(self, vals: list) -> None:
+        """Count batch of events and refresh progress line"""
+
+        final = False
+        for val in vals:
+            func = val.get('func')
+            if func == 'main':
+                final = True
+                self.dropped = val.get('dropped', 0)
+            elif func == 'row':
+                self.rows += 1
+                self.errors += not val['status']
+            else:
+                counts = self.stages.setdefault(func, [0, 0])
+                counts[0 if val.get('status') else 1] += 1
+
+        now = time.monotonic()
+        if final or now - self.shown >= self.interval:
+            self.shown = now
+            self.show(final)
+
+    def show(self, final: bool = False) -> None:
+        """Print progress line over previous one, with prefix every line is new as several processes share console"""
+
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        stages = ' '.join(f'{func} {ok}/{failed}' for func, (ok, failed) in self.stages.items())
+        start = self.prefix or '\r'
+        dropped = f', {self.dropped} events dropped' if self.dropped else ''
+        print(f'{start}{self.rows} rows, {self.rows / elapsed:.1f} rows/s, {self.errors} errors{dropped} | {stages}',
+              end='\n' if final or self.prefix else '', file=self.stream, flush=True)
+
+
+class eventbus:
+    """
+    Subscriber between pipelines and real subscribers. Events go to queue and background dispatcher
+    delivers them in batches, so slow subscriber does not stall requests. When size events are waiting
+    new events of stages are dropped, rows and end of run are always delivered, there is one row per activity.
+    """
+
+    def __init__(self, subscribers: list, size: int = 10000, batch: int = 500) -> None:
+        self.subscribers = subscribers
+        self.queue = asyncio.Queue()
+        self.size = size
+        self.batch = batch
+        self.dropped = 0
+        self.task = None
+
+    async def event(self, e: dict) -> dict:
+        """Put event to queue without waiting"""
+
+        if self.task is None:
+            self.task = asyncio.create_task(self.dispatch())
+
+        if self.queue.qsize() >= self.size and e.get('func') not in ('row', 'main'):
+            self.dropped += 1
+            metrics.count('esup_events_dropped_total')
+            return e
+        self.queue.put_nowait(e)
+        return e
+
+    async def deliver(self, subscriber: object, batch: list) -> None:
+        """Give batch to subscriber, one by one if it can not take batches"""
+
+        if hasattr(subscriber, 'batch'):
+            await subscriber.batch(batch)
+        else:
+            for e in batch:
+                await subscriber.event(e)
+
+    async def dispatch(self) -> None:
+        """Deliver batches until None is received"""
+
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            stop = None in batch
+            batch = [e for e in batch if e is not None]
+            for subscriber in self.subscribers:
+                try:
+                    await self.deliver(subscriber, batch)
+                except Exception as e:
+                    print(f'Subscriber {subscriber} failed: {e}', file=sys.stderr)
+            if stop:
+                return
+
+    async def close(self) -> None:
+        """Deliver the rest of events and stop dispatcher"""
+
+        if self.task is None:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+
 
 @app.command()
 def upload(from_file: Annotated[str, typer.Option('--file', '-f')],
            from_column: Annotated[int, typer.Option('--column', '-c')], 
-           idx: Annotated[int, typer.Option('--idx', '-i')] = 0) -> None:
-    """Upload data to esup"""
+           idx: Annotated[int, typer.Option('--idx', '-i')] = 0,
+           from_sheet: Annotated[int, typer.Option('--sheet', '-s')] = 2,
+           task_name: Annotated[str, typer.Option('--task', '-t', help='Name of task in activity')] = DEFAULT_TASK,
+           param: Annotated[str, typer.Option('--param', '-p', help='Parameter of task to change')] = DEFAULT_PARAM,
+           concurrency: Annotated[int, typer.Option('--concurrency', '-n', help='Max requests in flight per endpoint')] = 8,
+           retries: Annotated[int, typer.Option('--retries', '-r', help='Retries for failed requests')] = 3,
+           batch: Annotated[int, typer.Option('--batch', '-b', help='Activities per Grid_Read request, 1 for one by one')] = 200,
+           cache_path: Annotated[str, typer.Option('--cache', help='File of identifiers cache')] = 'cache.sqlite',
+           dry_run: Annotated[bool, typer.Option('--dry-run', help='Only show changes, send nothing')] = False,
+           transport: Annotated[str, typer.Option('--transport', help='thread (requests in threads) or aio (aiohttp)')] = 'thread') -> None:
+    """Upload data to esup, changes are sent to endpoint from ESUPSAVE environment variable"""
+
+    if not dry_run and not SAVE_METHOD:
+        print('Endpoint of saving is not set, nothing is sent. Set ESUPSAVE to it (like EsupTask/SaveParameters) '
+              'after checking it on server, until then only --dry-run works', file=sys.stderr)
+        raise typer.Exit(1)
+
+    from_time = time.time()
+    result = asyncio.run(uploadmain(from_file, from_column, from_sheet, idx, concurrency=concurrency, retries=retries,
+                                    batch=batch, cache_path=cache_path, task_name=task_name, param=param, dry_run=dry_run,
+                                    transport=transport))
+
+    for activityId, error in result['errors'].items():
+        print(f'{activityId}: rejected, {error}')
 
-    xl = pd.ExcelFile(from_file)
-    df = xl.parse(xl.sheet_names[2])
-    df2 = df[[df.columns[idx], df.columns[from_column]]]
+    for activityId, changes in result['changes'].items():
+        for name, (old, new) in changes.items():
+            print(f'{activityId}: {name}: {edate.value(old)} -> {edate.value(new)}')
+
+    verb = 'Planned' if dry_run else 'Sent'
+    print(f'{verb} {len(result["changes"])} changes, {result["unchanged"]} unchanged, {result["failed"]} failed '
+          f'in {time.time() - from_time} seconds')
     
 
 @app.command()
 def download(to_file: Annotated[str, typer.Option('--file', '-f')], 
              to_column: Annotated[int, typer.Option('--column', '-c')]=None, 
              to_sheet: Annotated[int, typer.Option('--sheet', '-s')]=0,
-             idx: Annotated[int, typer.Option('--idx', '-i')] = 0) -> None:
+             idx: Annotated[int, typer.Option('--idx', '-i')] = 0,
+             concurrency: Annotated[int, typer.Option('--concurrency', '-n', help='Max requests in flight per endpoint')] = 16,
+             retries: Annotated[int, typer.Option('--retries', '-r', help='Retries for failed requests')] = 3,
+             batch: Annotated[int, typer.Option('--batch', '-b', help='Activities per Grid_Read request, 1 for one by one')] = 200,
+             cache_path: Annotated[str, typer.Option('--cache', help='File of identifiers cache')] = 'cache.sqlite',
+             output: Annotated[str, typer.Option('--output', '-o', help='Result file, .csv or .parquet, datas.delta.csv next to workbook in delta mode')] = None,
+             fresh: Annotated[bool, typer.Option('--fresh', help='Ignore checkpoint of previous run')] = False,
+             task_name: Annotated[str, typer.Option('--task', '-t', help='Name of task in activity')] = DEFAULT_TASK,
+             params: Annotated[List[str], typer.Option('--param', '-p', help='Parameter of task, may be repeated')] = None,
+             metrics_path: Annotated[str, typer.Option('--metrics', help='JSON summary of stage latencies and counters')] = 'metrics.json',
+             profile_path: Annotated[str, typer.Option('--profile', help='Save cProfile stats of all threads to file')] = None,
+             transport: Annotated[str, typer.Option('--transport', help='thread (requests in threads) or aio (aiohttp)')] = 'thread',
+             workers: Annotated[int, typer.Option('--workers', '-w', help='Processes sharing ids, concurrency is divided between them')] = 1,
+             tz: Annotated[str, typer.Option('--tz', help='Time zone of dates like Europe/Moscow, local time without zone if not set')] = None,
+             delta: Annotated[bool, typer.Option('--delta', help='Load only activities changed since last sync, write only changed rows')] = False,
+             max_age: Annotated[float, typer.Option('--max-age', help='In delta mode load activities fetched earlier than this anyway, hours')] = 24.0,
+             config: Annotated[str, typer.Option('--config', '-g', help='JSON file of pipelines with several tasks, replaces --task and --param')] = None) -> None:
     """Donloads data from esup"""
 
+    items = 'changed rows' if delta else 'items'
+    if workers > 1:
+        from_time = time.time()
+        cnt, shards = sharded(to_file, to_sheet, idx, workers, concurrency=concurrency, retries=retries, batch=batch,
+                              cache_path=cache_path, output=output, resume=not (fresh or delta), task_name=task_name,
+                              params=params, profile_path=profile_path, transport=transport, tz=tz,
+                              delta=delta, max_age=max_age * 3600, config=config)
+        elapsed = time.time() - from_time
+        print(f'Completed in {elapsed} seconds for {cnt} {items} by {len(shards)} workers')
+
+        if metrics_path:
+            with open(metrics_path, 'w', encoding='utf-8') as f:
+                json.dump({'shards': shards, 'items': cnt, 'seconds': elapsed}, f, ensure_ascii=False, indent=2)
+        return
+
+    profile = None
+    if profile_path:
+        profile = profiler()
+        profile.thread()
+
     from_time = time.time()
-    cnt = asyncio.run(main(to_file, to_column, to_sheet, idx))
-    print(f'Completed in {time.time() - from_time} seconds for {cnt} items')
-    
-async def main(to_file: str, to_column: int, to_sheet: int, idx: int, subscriber=None) -> int:
-    """Function launch all coroutins for downloads and uploads values"""
+    cnt = asyncio.run(main(to_file, to_column, to_sheet, idx, concurrency=concurrency, retries=retries, batch=batch,
+                           cache_path=cache_path, output=output, resume=not (fresh or delta), task_name=task_name,
+                           params=params, profile=profile, transport=transport, tz=tz, delta=delta, max_age=max_age * 3600,
+                           config=config))
+    elapsed = time.time() - from_time
+    print(f'Completed in {elapsed} seconds for {cnt} {items}')
 
-    xl = pd.ExcelFile(to_file)
-    df = xl.parse(xl.sheet_names[to_sheet])
-    df = df[df.columns[idx]]
-    
-    try:
-        activites = pickle.load(open('cache.pickle', 'rb'))
-    except(OSError, IOError) as e:
-        activites = dict()
+    if profile is not None:
+        profile.dump(profile_path)
+
+    if metrics_path:
+        summary = dict(metrics.summary(), items=cnt, seconds=elapsed)
+        with open(metrics_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+@app.command()
+def watch(to_file: Annotated[str, typer.Option('--file', '-f')],
+          to_sheet: Annotated[int, typer.Option('--sheet', '-s')] = 0,
+          idx: Annotated[int, typer.Option('--idx', '-i')] = 0,
+          interval: Annotated[float, typer.Option('--interval', help='Minutes between starts of refreshes')] = 60.0,
+          count: Annotated[int, typer.Option('--count', help='Stop after this many refreshes, 0 for never')] = 0,
+          concurrency: Annotated[int, typer.Option('--concurrency', '-n', help='Max requests in flight per endpoint')] = 16,
+          retries: Annotated[int, typer.Option('--retries', '-r', help='Retries for failed requests')] = 3,
+          batch: Annotated[int, typer.Option('--batch', '-b', help='Activities per Grid_Read request')] = 200,
+          cache_path: Annotated[str, typer.Option('--cache', help='File of identifiers cache and sync state')] = 'cache.sqlite',
+          output: Annotated[str, typer.Option('--output', '-o', help='Name of result files, time of refresh is added to it')] = None,
+          task_name: Annotated[str, typer.Option('--task', '-t', help='Name of task in activity')] = DEFAULT_TASK,
+          params: Annotated[List[str], typer.Option('--param', '-p', help='Parameter of task, may be repeated')] = None,
+          max_age: Annotated[float, typer.Option('--max-age', help='Load activities fetched earlier than this anyway, hours')] = 24.0,
+          tz: Annotated[str, typer.Option('--tz', help='Time zone of dates like Europe/Moscow, local time without zone if not set')] = None,
+          transport: Annotated[str, typer.Option('--transport', help='thread (requests in threads) or aio (aiohttp)')] = 'thread',
+          config: Annotated[str, typer.Option('--config', '-g', help='JSON file of pipelines with several tasks, replaces --task and --param')] = None) -> None:
+    """Refresh ids of workbook on schedule by delta sync, every refresh with changes writes them to own file"""
+
+    base, ext = os.path.splitext(outputpath(to_file, output, delta=True))
+    done = 0
+    while True:
+        from_time = time.time()
+        path = f'{base}.{time.strftime("%Y%m%d-%H%M%S")}{ext}'
+        try:
+            cnt = asyncio.run(main(to_file, None, to_sheet, idx, concurrency=concurrency, retries=retries, batch=batch,
+                                   cache_path=cache_path, output=path, resume=False, task_name=task_name, params=params,
+                                   transport=transport, tz=tz, delta=True, max_age=max_age * 3600, config=config))
+        except Exception as e:
+            # failed refresh is repeated by schedule, rows written before failure are kept in its file
+            cnt = None
+            print(f'{time.strftime("%Y-%m-%d %H:%M:%S")}: refresh failed, {type(e).__name__}: {e}', file=sys.stderr, flush=True)
+
+        # sync state is kept in cache, checkpoint of refresh is not needed
+        if os.path.exists(path + '.checkpoint'):
+            os.remove(path + '.checkpoint')
+        if cnt == 0 and os.path.exists(path):
+            os.remove(path)
+        if cnt is not None:
+            print(f'{time.strftime("%Y-%m-%d %H:%M:%S")}: {cnt} changed rows' + (f' in {path}' if cnt else '') +
+                  f', {time.time() - from_time:.1f} seconds', flush=True)
+
+        done += 1
+        if count and done >= count:
+            return
+        time.sleep(max(0.0, interval * 60 - (time.time() - from_time)))
+
+
+async def main(to_file: str, to_column: int, to_sheet: int, idx: int, subscriber=None,
+               concurrency: int = 16, retries: int = 3, batch: int = 200, cache_path: str = 'cache.sqlite',
+               output: str = None, resume: bool = True, task_name: str = None, params: list = None,
+               profile: profiler = None, transport: str = 'thread', ids: list = None, tz: str = None,
+               delta: bool = False, max_age: float = 24 * 60 * 60, config: str = None) -> int:
+    """
+    Function launch all coroutins for downloads and uploads values, ids given by caller replace column of workbook.
+    Config file of pipelines (see taskgraph) replaces task_name and params, every pipeline gives its own columns.
+    Delta mode reads grid rows of all activities, loads task pages only for ones whose row changed since last sync
+    or which were fetched more than max_age seconds ago, and writes only rows with changed values.
+    Returns count of activities, in delta mode count of changed rows.
+    """
+
+    graph = taskgraph.load(config) if config else None
+    task_name = graph.tasks[0] if graph else task_name or DEFAULT_TASK
+    params = graph.columns() if graph else params or [DEFAULT_PARAM]
+    synckey = (graph or taskgraph([{'task': task_name, 'params': params}])).key()
+    last = 'taskgraph' if graph else 'getValues'
+    limits = scheduler(concurrency, retries, profile=profile)
+
+    # workbook is read first, so missing or locked one does not truncate result of previous run
+    if ids is None:
+        ids = await asyncio.to_thread(workbooks.column, to_file, to_sheet, idx)
+    writer = resultwriter(outputpath(to_file, output, delta), params, resume=resume, tz=tz)
+    ids = [val for val in uniqueids(ids) if str(val) not in writer.done]
+
+    cache = activitycache(cache_path)
+    bus = eventbus([subscriber if subscriber is not None else consoler()])
+    activites = dict()
 
     tasks = []
     line = {
         'FindByActivityId': '',
-        'GridRead': 'Готовность к работам по БС',
+        'GridRead': task_name,
         'EsupTask': '',
-        'getValue': 'Дата готовности к работам по БС'
+        'getValues': params
        }
     
+    for val in ids:
+        activites[val] = extruder(val, limits, cache, client(transport))
+        await activites[val].addsubscriber(bus)
+    cnt = len(activites)
+
+    if graph and not delta:
+        # saved grid row has all tasks of graph, activities without the first task do not read grid again
+        for item in activites.values():
+            item.cachedtasks()
+
+    await resolve(list(activites.values()), task_name, batch, fresh=delta)
+
+    items = list(activites.values())
+    if delta:
+        state = cache.synced(synckey)
+        items = [v for v in items if v.GridHash is None or v.activityId not in state or
+                 state[v.activityId][0] != v.GridHash or time.time() - state[v.activityId][2] > max_age]
+        metrics.count('esup_delta_skipped_total', cnt - len(items))
+        byid = {v.activityId: v for v in items}
+        cnt = 0
+
+    for item in items:
+        tasks.append(asyncio.create_task(graph.run(item) if graph else item.pipeline(line)))
+
+    for task in asyncio.as_completed(tasks):
+        res = await task
+        status = res['func']==last and res['status']
+        if status and delta:
+            activityId, value = res['value']
+            value = {p: value.get(p, None) for p in params}
+            old = state.get(activityId)
+            cache.putsync(activityId, synckey, byid[activityId].GridHash, value)
+            if old is None or old[1] != value:
+                writer.write(activityId, value)
+                cnt += 1
+        elif status:
+            writer.write(*res['value'])
+        await bus.event({'func': 'row', 'status': status, 'id': res.get('id')})
+
+    writer.close()
+
+    cache.close()
+    limits.close()
+    await aiohttpclient.close()
+    
+    await bus.event({'func': 'main', 'status': True, 'id': 'fin', 'value': cnt, 'dropped': bus.dropped})
+    await bus.close()
+    return cnt
+
+
+def outputpath(to_file: str, output: str = None, delta: bool = False) -> str:
+    """Result file, by default next to workbook, delta sync has its own so full extract is not replaced by changes"""
+
+    return output or os.path.join(os.path.dirname(to_file), 'datas.delta.csv' if delta else 'datas.csv')
+
+
+def uniqueids(values: list) -> list:
+    """Ids in order of the first appearance, 100 and '100' are the same activity"""
+
+    unique = dict()
+    for val in values:
+        unique.setdefault(str(val), val)
+    metrics.count('esup_duplicate_ids_total', len(values) - len(unique))
+    return list(unique.values())
+
+
+def client(transport: str) -> type:
+    """Class of http client by name of transport"""
+
+    if transport not in ('thread', 'aio'):
+        raise ValueError(f'Unknown transport: {transport}, use thread or aio')
+    return aiohttpclient if transport == 'aio' else http
+
+
+def shardpath(output: str, n: object) -> str:
+    """Result file of shard, its checkpoint is next to it"""
+
+    base, ext = os.path.splitext(output)
+    return f'{base}.shard{n}{ext}'
+
+
+def shardfiles(output: str) -> list:
+    """Checkpoints of shards left on disk"""
+
+    base, ext = os.path.splitext(output)
+    return sorted(glob.glob(glob.escape(base) + '.shard*' + glob.escape(ext) + '.checkpoint'))
+
+
+def dropshard(checkpoint: str) -> None:
+    """Remove checkpoint of shard and its result file"""
+
+    for path in (checkpoint, checkpoint[:-len('.checkpoint')]):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def shard(n: int, ids: list, output: str, profile_path: str = None, **kwargs) -> tuple:
+    """Run main() for part of ids in this process, returns count of items and metrics summary"""
+
+    profile = None
+    if profile_path:
+        profile = profiler()
+        profile.thread()
+
+    cnt = asyncio.run(main(None, None, 0, 0, consoler(interval=5.0, prefix=f'shard {n}: '), output=shardpath(output, n),
+                           resume=False, profile=profile, ids=ids, **kwargs))
+    if profile is not None:
+        profile.dump(f'{profile_path}.shard{n}')
+    return cnt, metrics.summary()
+
+
+def merge(writer: resultwriter, output: str) -> int:
+    """Move results of finished or crashed shards to main output through its checkpoint, returns count of rows"""
+
     cnt = 0
-    for val in df:
-        if not activites.get(val, False):
-            activites[val] = extruder(val)
+    for checkpoint in shardfiles(output):
+        with open(checkpoint, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    if isinstance(rec['value'], dict):
+                        writer.write(rec['id'], rec['value'])
+                        cnt += 1
+        dropshard(checkpoint)
+    return cnt
 
-        if not subscriber is None:
-            await activites[val].addsubscriber(subscriber)
-        else:
-            await activites[val].addsubscriber(consoler())
-        
-        cnt += 1
+
+def sharded(to_file: str, to_sheet: int, idx: int, workers: int, concurrency: int = 16, output: str = None,
+            resume: bool = True, params: list = None, tz: str = None, **kwargs) -> tuple:
+    """
+    Split ids of workbook between worker processes, every one with own event loop, connection pool and shard of output.
+    Shards share activity cache (SQLite WAL) and are merged into one output at the end,
+    concurrency is divided between workers so load of server stays the same. Returns count of items and summaries of shards.
+    """
+
+    output = outputpath(to_file, output, kwargs.get('delta', False))
+    if kwargs.get('config'):
+        params = taskgraph.load(kwargs['config']).columns()
+    params = params or [DEFAULT_PARAM]
+    ids = workbooks.column(to_file, to_sheet, idx)
+    writer = resultwriter(output, params, resume=resume, tz=tz)
+    if resume:
+        merge(writer, output)
+    else:
+        for checkpoint in shardfiles(output):
+            dropshard(checkpoint)
+
+    ids = [val for val in uniqueids(ids) if str(val) not in writer.done]
+    shards = [ids[n::workers] for n in range(workers) if ids[n::workers]]
+    per = max(1, -(-concurrency // max(len(shards), 1)))
+
+    cnt, summaries = 0, list()
+    with ProcessPoolExecutor(max(len(shards), 1)) as pool:
+        futures = [pool.submit(shard, n, part, output, concurrency=per, params=params, tz=tz, **kwargs)
+                   for n, part in enumerate(shards)]
+        for future in futures:
+            done, summary = future.result()
+            cnt += done
+            summaries.append(summary)
+
+    merge(writer, output)
+    writer.close()
+    return cnt, summaries
+
+
+async def resolve(items: list, task_name: str, batch: int, fresh: bool = False) -> None:
+    """
+    Find templates and views of all activities first, so tasks can be resolved by Grid_Read batches.
+    Activities of one type share view and template, so pairs known from cache or found in this run are probed
+    by Grid_Read with all unresolved ids, and FindByActivityId is asked in waves only for the rest.
+    Probing stops when a round finds fewer activities than requests it cost.
+    Fresh reads grid rows of all activities even when their tasks are cached, delta sync needs them.
+    """
+
+    if (batch <= 1 and not fresh) or not items:
+        return
+    batch = max(batch, 1)
+
+    cache = items[0].cache
+    wave = (items[0].scheduler or scheduler.shared()).concurrency
+    known = lambda v: not (v.TemplateId is None or v.ViewId is None)
+
+    pending = [v for v in items if not v.cachedtemplate()]
+    pairs = cache.templates() if cache is not None else set()
+    pairs |= {(v.ViewId, v.TemplateId) for v in items if known(v)}
+    probed, probing = set(), True
+
+    while pending:
+        unprobed = pairs - probed
+        if probing and unprobed:
+            cost = len(unprobed) * -(-len(pending) // batch)
+            found = await asyncio.gather(*(extruder.GridReadProbe(pending, viewId, templateId, task_name, batch)
+                                           for viewId, templateId in unprobed))
+            probed |= unprobed
+            probing = sum(found) >= cost
+            pending = [v for v in pending if not known(v)]
+
+        part, pending = (pending[:wave], pending[wave:]) if probing else (pending, list())
+        await asyncio.gather(*(v.FindByActivityId() for v in part))
+        pairs |= {(v.ViewId, v.TemplateId) for v in part if known(v)}
+
+    await extruder.GridReadBatch(items, task_name, batch, fresh=fresh)
+
+
+async def uploadmain(from_file: str, from_column: int, from_sheet: int, idx: int, subscriber=None,
+                     concurrency: int = 8, retries: int = 3, batch: int = 200, cache_path: str = 'cache.sqlite',
+                     task_name: str = None, param: str = None, dry_run: bool = False, transport: str = 'thread') -> dict:
+    """
+    Function launch coroutins for uploading values. Values are compared with loaded tasks
+    and only changed parameters are sent, returns changes by activity, counts of unchanged and failed rows
+    and reasons of rows rejected before sending.
+    """
+
+    if not dry_run and not SAVE_METHOD:
+        raise RuntimeError('Endpoint of saving is not set, set ESUPSAVE (like EsupTask/SaveParameters) or use dry run')
+
+    task_name = task_name or DEFAULT_TASK
+    param = param or DEFAULT_PARAM
+    limits = scheduler(concurrency, retries)
+    cache = activitycache(cache_path)
+    bus = eventbus([subscriber if subscriber is not None else consoler()])
+
+    rows = await asyncio.to_thread(lambda: list(workbooks.rows(from_file, from_sheet, [idx, from_column])))
+    values = dict()
+    for val, new in rows[1:]:
+        if val is not None and new is not None:
+            values[val] = new
+
+    activites = dict()
+    for val in values:
+        activites[val] = extruder(val, limits, cache, client(transport))
+        await activites[val].addsubscriber(bus)
+
+    await resolve(list(activites.values()), task_name, batch)
+
+    tasks = []
+    for val, new in values.items():
+        line = {
+            'FindByActivityId': '',
+            'GridRead': task_name,
+            'EsupTask': '',
+            'setValues': {param: new}
+           }
+        if not dry_run:
+            line['saveValues'] = ''
         tasks.append(asyncio.create_task(activites[val].pipeline(line)))
 
-    results = await asyncio.gather(*tasks)
-    finded_datas = dict()
-    for res in results:
-        if res['func']=='getValue' and res['status']:
-            finded_datas[res['value'][0]] = edate(res['value'][1]).datetime()
+    result = {'changes': dict(), 'unchanged': 0, 'failed': 0, 'errors': dict()}
+    last = 'setValues' if dry_run else 'saveValues'
+    for task in asyncio.as_completed(tasks):
+        res = await task
+        status = res['func'] == last and res['status']
+        if not status:
+            result['failed'] += 1
+            if res.get('error'):
+                result['errors'][res.get('id')] = res['error']
+        elif res['value'][1]:
+            result['changes'][res['value'][0]] = res['value'][1]
+        else:
+            result['unchanged'] += 1
+        await bus.event({'func': 'row', 'status': status, 'id': res.get('id')})
 
-    df = pd.DataFrame.from_dict({'esupid':list(finded_datas.keys()), 'dates':list(finded_datas.values())})
-    df.to_csv(os.path.dirname(to_file) + '/datas.csv')
+    cache.close()
+    limits.close()
+    await aiohttpclient.close()
 
-    for v in activites.values():
-        v.clear()
-    
-    with open('cache.pickle', 'wb') as f:
-        pickle.dump(activites, f, protocol=pickle.HIGHEST_PROTOCOL)
-    
-    if not subscriber is None:
-        await subscriber.event({'func': 'main', 'status': True, 'id': 'fin', 'value': cnt})
-    return cnt
+    await bus.event({'func': 'main', 'status': True, 'id': 'fin', 'value': len(tasks)})
+    await bus.close()
+    return result
 
 
 @app.callback(invoke_without_command=True)
@@ -476,56 +2468,22 @@ def web_server(ctx: typer.Context) -> None:
     """If option did't present we will start web server"""
 
     if ctx.invoked_subcommand is None:
+        from aiohttp import web
+        from webassets import DATA
+
         web_content = webmethods(DATA)
         wapp = web.Application()
         wapp.add_routes([web.get('/', web_content.index),
                          web.get('/file', web_content.fileupload),
                          web.get('/tableopen', web_content.tableopen),
                          web.get('/dataload', web_content.dataload), 
-                         web.get('/update', web_content.update)])
+                         web.get('/update', web_content.update),
+                         web.get('/events', web_content.events),
+                         web.get('/items', web_content.itemspage),
+                         web.get('/metrics', web_content.metricspage)])
         os.system('start http://localhost:9999')
         web.run_app(wapp, port=9999)
 
-"""Web interface"""
-DATA = """eJy1WG1v2zgS/mz/Cla9rWRs5DovvjSuHaC7yO720H3Btrc44FAUtE
-hF3EqilqTieIv895shKVlyHDvB7sFIbA05zzzzwiGpeWaK/HI4zzhl8KXNOueXQ1
-FWtfkia5OLks9IKUv++m6oec6T+2KTfUllaWIt/gTh7W2sC5rnOMAeGBgXVJTxSp
-RMroZfhoOVYCabkePJ5KvXw0HGxXVmZuR0Mqlu4XkpFeMqVpSJWs/I1AqZ0FVO1z
-OS5hyf8StmQgFBIcsZSWReF+XrIRgzsoorWvIcTR3SU3JllQrBWM43eg2pE8epoO
-oaXABopP0oRhbZSVeKgh7+t7aW0hhZbGz9reCGLrt+7EpIm4CLXvyPe/GH5+qWaJ
-kLRp6nF/h5KDfyhqs0l6v4dkZ0oqQ10QrXHeHj3UhF1wvPt6mQAqJ1mPUyp8nnv1
-pPTXJUYw21G3522cQ5XfZYnnhG2wwd0ozQ2sitf8gSyF4rWZdsBvGe4AekFWVMlN
-cz8grcOnbUk1ppCZ5WUpSGq4c83JFGdoqfnfxnGSYMvdgQiSEIaOj55JQvX9EtvY
-7Hk/Fxz+PmWVY0EQaCbF2RWrjY0iXwqQ0H4Z+AxTjUTXxs4YXhhbYsdrp0n1pygZ
-+9+W/ifgIjnb9udFGp87cryEDuNo91xrnRO/rK/4GvL4yWpH9+gJkr2H1ppLlI+D
-Kv+QMgfsmZbLe6ul5GxxfnR+Tk9Az+TaejjheTnSEgE//nwtFr+43BTGjTbbh+U2
-iBu+tN84oqaqR6SmfX9bIQJl6a8q/5lfPUdNOFeidH5OKfR7AwJ6P7AfCON4G410
-v6XeJk6j3VhioTp1IVyPdGaLEUuV1FGexR3O5x85d+456/9Bv5UrL15XAwh1YrKg
-O/Bmld2kiQa26iWuUjkAHgYKC4qVVJSr4ivyhZCM2jSNdJwjk7IikV+YgsEMDNHi
-Sy1IbcZoosrM5/fnz3gzHVr/yPmmsTjewkGB7LipdR+P3Vh/CIeHtuAAr46oaX5h
-2kmpdcRWEuKYNZ0cgZ8pYGIo1wPkTA1JpcLrCVkhcvSEc4J2eTiYNutAaevNVVXF
-dAmPspdzzXvD8bPYzQkSulJHDxjljPOTTff3zZmPvAb81dOGrA7NfdHscCjpiB84
-xsW/qJm5VUn4mdBKgbIM1L5iJp0cFQN4G2KdYVo4ZHXf+sRy49cvk7pOdf73/+aQ
-xLRPfnDXJuyPITMPl3xWCaUbWNyRul6HqcQg1EoD8aQ81d0SSLIjQ46tYAJAZl44
-zqn1clVE3FlVlHoWDhCBO0c9CFcM8EdLAJrs+O8wbOnQXwZDKpCwjvGCr4CkTw85
-v1WwZmw68R8L9o/+OorZ1nTujtftyqEoSWOR/n8joKfQr8ENob2xU13vSHb7E9AI
-tAcRZ0qomIlETOknXgI1ksSPgd7GPfrN9Awm5grb5l4Zb1vSbC5+l5Mj1PwoNmvl
-eC/Qor/onw/Dw9n14chr+CMvtA9ecnwp8dp/Ts+DA85PE3ChvQE+En0+XpZHoYHm
-8Z29Cdsk9p2wvaOttTZfcqDGjuIfkqSVPWZLBfbN/KooIlyAksMBKSr4mDvrGh+A
-jPoVviYa/P9DDsihy2g64HQck37o2cv5qbD6LgcGOLXL84IlPfLu/u9xXfUrY3Bt
-wvAjcWjMYmg67edBPYGHZ3o9E4oQZah11XOKshbwVOPHqgtbkpOxtbG0JspeEOfX
-AYtvEI/CzrYqsnwnb5SbA9GQ6w7gQLRn0dbIiHtHBO0CTBGRrbfD5bBE7e3TwFA5
-L7IGE4gDroArVJayygyT02cPjxVjZgGzu93svhIqkAYDMAB6hPbFXuMwBTYrjil7
-i9d6OKqnW1lxuqwpRWcSusi77L+xvGteK8dCuxi4Hnl7qwYu+Lh9icsVDbPuU8tI
-XWtpstNr7aHkVnlUGVhwftutPdZh5E4+C8LfeCYA9prBrcivvpf1JgYSfc2N1gPD
-mwBzzsTvRtCw68/mA7Z+KGJDnVehF2XiuFePjtDLUvgXBgMMfjNCm4ySRbBFB7Aa
-G2gSwCvFgEds5GO9i8fbBD98fam4gbH8ztlZiYdcUXgYFTY0BKWsBvaJNUoz0XbU
-hB34TJgEpuFsH7iiciXRPotwTFxEj7G+eRlUABPOUCD3spdBRYOSIVXOldDNydp7
-W1uQJ5HlgrL56/ml6cvfYOvgQP3S/31o8UdW4EbFs9vnhZA4X5szh+T284s+x0HH
-sMp2qD2eDNX2Lot+Ibdl5ShQ7OSeKubvvdCX73NV1wILMYettQfCrsxcq72w2WW1
-APJQzJeRnQO6huXxD0lK3kMap2l4A7fKdWBPjkN6lD2r7/79a329V9hKZMHALErV
-Vtu3hbQu2t1KH2Wv1TkH2T34frp/TKB4vgctBf4933qKHVTkXpy9OeUmw9+TJqv9
-xNGS7O+CL8f0C4IZ0="""
 
 if __name__ == '__main__':
     app()
@@ -0,0 +1,160 @@
+"""
+Local stand-in of ESUP for tests and benchmarks.
+Serves Activities/FindByActivityId, Activities/Grid_Read and EsupTask with payloads shaped like the real ones,
+latency, error rate and size of task pages are configurable. Use with ESUPPATH=host:port and ESUPAUTH=none,
+uploads need ESUPSAVE=EsupTask/SaveParameters.
+"""
+
+import re
+import json
+import time
+import random
+import asyncio
+import typer
+from aiohttp import web
+from urllib.parse import parse_qs
+from typing_extensions import Annotated
+
+TASKS = ['Готовность к работам по БС', 'Согласование проекта', 'Приемка работ']
+PARAMS = ['Дата готовности к работам по БС', 'Дата согласования', 'Ответственный', 'Комментарий']
+
+
+class mockesup:
+    """Handlers of mock server, every activity id gives the same answers on every call"""
+
+    def __init__(self, latency: float = 0.02, jitter: float = 0.5, errors: float = 0.0,
+                 page_kb: int = 100, templates: int = 5, negotiate: bool = False) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.errors = errors
+        self.page_kb = page_kb
+        self.templates = templates
+        self.negotiate = negotiate
+        self.padding = ('<div class="filler">' + 'x' * 1000 + '</div>\n') * max(page_kb, 1)
+        self.requests = dict()
+        self.saved = dict()
+        self.modified = dict()
+
+    async def delay(self, name: str) -> bool:
+        """Sleep for latency of server and tell if this request must fail"""
+
+        self.requests[name] = self.requests.get(name, 0) + 1
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.latency * self.jitter)))
+        return random.random() < self.errors
+
+    def template(self, activityId: str) -> int:
+        return int(activityId) % self.templates
+
+    def tasks(self, activityId: str) -> dict:
+        """TaskList columns of grid row"""
+
+        return {f'TaskList{n}': {'ID': int(activityId) * 10 + n, 'Name': name} for n, name in enumerate(TASKS)}
+
+    def row(self, activityId: str) -> dict:
+        """Grid row of activity, its modification date changes when parameters are saved"""
+
+        modified = self.modified.get(int(activityId), 1700000000000)
+        return dict({'ID': int(activityId), 'Name': f'Activity {activityId}', 'Modified': f'/Date({modified})/'},
+                    **self.tasks(activityId))
+
+    def item(self, taskId: int) -> dict:
+        """Item of task page"""
+
+        activityId = taskId // 10
+        stamp = 1700000000000 + activityId * 3600000
+        values = [f'/Date({stamp})/', f'/Date({stamp + 86400000})/', f'user{activityId % 97}', 'Комментарий ' * 5]
+        saved = self.saved.get(taskId, dict())
+        return {'ID': taskId, 'Name': TASKS[taskId % 10 % len(TASKS)], 'ActivityId': activityId,
+                'Parameters': [{'Name': name, 'Value': saved.get(name, value), 'Type': 'String'}
+                               for name, value in zip(PARAMS, values)]}
+
+    async def findbyactivityid(self, request: object) -> object:
+        if await self.delay('FindByActivityId'):
+            return web.Response(status=503)
+
+        m = re.search(r"'activityId':\s*'([0-9]+)'", await request.text())
+        if m is None:
+            return web.json_response(dict())
+        template = self.template(m.group(1))
+        return web.json_response({'TemplateId': 1000 + template, 'ViewId': 2000 + template})
+
+    async def gridread(self, request: object) -> object:
+        if await self.delay('GridRead'):
+            return web.Response(status=503)
+
+        form = parse_qs(await request.text(), keep_blank_values=True)
+        m = re.search(r'"IsContainedIn","value":"([0-9,]*)"', form.get('filter', [''])[0])
+        ids = [i for i in (m.group(1).split(',') if m else list()) if i]
+        template = int(form.get('templateId', ['0'])[0] or 0) - 1000
+        ids = [i for i in ids if self.template(i) == template]
+
+        page = int(form.get('page', ['1'])[0] or 1)
+        size = int(form.get('pageSize', ['1'])[0] or 1)
+        rows = [self.row(i) for i in ids[(page - 1) * size:page * size]]
+        return web.json_response({'Data': rows, 'Total': len(ids)})
+
+    async def esuptask(self, request: object) -> object:
+        if await self.delay('EsupTask'):
+            return web.Response(status=503)
+
+        taskId = request.rel_url.query.get('taskId', '')
+        if not taskId.isdigit():
+            return web.Response(status=404)
+
+        item = json.dumps(self.item(int(taskId)), ensure_ascii=False)
+        html = ('<html><head><title>Task</title></head><body>\n' + self.padding +
+                '<script>var model = kendo.observable({ Item : ' + item + '});</script>\n' +
+                self.padding + '</body></html>')
+        return web.Response(text=html, content_type='text/html')
+
+    async def save(self, request: object) -> object:
+        """Saves parameters of task, they are shown on next loads of its page"""
+
+        if await self.delay('saveValues'):
+            return web.Response(status=503)
+
+        body = json.loads(await request.read())
+        saved = self.saved.setdefault(int(body['taskId']), dict())
+        for val in body.get('Parameters', list()):
+            saved[val['Name']] = val['Value']
+        self.modified[int(body['taskId']) // 10] = int(time.time() * 1000)
+        return web.json_response({'success': True})
+
+    async def stats(self, request: object) -> object:
+        """Requests counted by endpoint"""
+
+        return web.json_response(self.requests)
+
+    @web.middleware
+    async def auth(self, request: object, handler: object) -> object:
+        """Asks for negotiate token like IIS does, token itself is not checked"""
+
+        if self.negotiate and not request.headers.get('Authorization', '').startswith('Negotiate '):
+            self.requests['401'] = self.requests.get('401', 0) + 1
+            return web.Response(status=401, headers={'WWW-Authenticate': 'Negotiate'})
+        return await handler(request)
+
+    def application(self) -> web.Application:
+        wapp = web.Application(middlewares=[self.auth])
+        wapp.add_routes([web.post('/Activities/FindByActivityId', self.findbyactivityid),
+                         web.post('/Activities/Grid_Read', self.gridread),
+                         web.get('/EsupTask', self.esuptask),
+                         web.post('/EsupTask/SaveParameters', self.save),
+                         web.get('/stats', self.stats)])
+        return wapp
+
+
+def serve(port: Annotated[int, typer.Option('--port')] = 8765,
+          latency: Annotated[float, typer.Option('--latency', help='Mean answer time, seconds')] = 0.02,
+          errors: Annotated[float, typer.Option('--errors', help='Share of answers with 503')] = 0.0,
+          page_kb: Annotated[int, typer.Option('--page-kb', help='Size of task page around Item, KB')] = 100,
+          templates: Annotated[int, typer.Option('--templates', help='Different templates of activities')] = 5,
+          negotiate: Annotated[bool, typer.Option('--negotiate', help='Answer 401 to requests without negotiate token')] = False) -> None:
+    """Start mock ESUP server"""
+
+    server = mockesup(latency=latency, errors=errors, page_kb=page_kb, templates=templates, negotiate=negotiate)
+    web.run_app(server.application(), host='127.0.0.1', port=port, print=None)
+
+
+if __name__ == '__main__':
+    typer.run(serve)
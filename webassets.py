@@ -0,0 +1,55 @@
+"""
+Web interface of extruder: html page packed with zlib and base64.
+Imported only when web server starts, so CLI commands do not parse it.
+"""
+
+DATA = """eNq1Gftv27j5Z/uvYNWtktHYcdJmbVw7h16R3W3oPXDthg2HopAlKuJKiRpJxfH1
+8r/v+0hKovxM0RsMP0R+7zfpea4LfjWc5zRO4UvpNadXQ1ZWtf4sas1ZSWekFCV9
+dT9UlNNke1nnnzNR6rFiv8Hi3d1YFTHnuJHu2ZgUMSvHK1amYjX8PBysWKrzGTmb
+Tv/8ajjIKbvJ9Yw8m06rO3heCplSOZZxymo1IxdmMWWq4vF6RjJO8Rm/ximTICAT
+5YwkgtdF+WoIzLSoxlVcUo6sjuFJsTJIBUtTTju8RqhzK1MRyxtQAUij2A+SyFC2
+qysZAx5+Gl5LobUoOl5/KHEdL309djmkdcBlz/5nPfvDc3VHlOAsJY+zS3zt8424
+pTLjYjW+mxGVSGFYtItrb/HhamTM18LJ20RIAdY6LvWSx8mnr42nxjmy4YbYjXwm
+bcY8XvakPHcSbUpoKc1IXGux8YFSgrA3UtRlOgN7T/EFq1Wcpqy8mZGXoNaZFT2p
+pRKgaSVYqancp+EON6bP8LVT/lmODkMtOkHGYARk9Hj6jC5fxht4nsbTyVlP4+ZZ
+VHHCNBjZqCIUs7aNlyBPrSks/ga0UgpxMz4z5JmmhTJS7FRpW7TkEl8H/d/Y/Rx2
+vLdvXUTy3ruMDMLd8bHKKdVqR135P8jrAqMV0j3vkcwG7CE3xpwldMlruoeISzmd
+70aXN8vo7PLFCTl/9hw+Li5GnhbTnSYgU/e25uiV/YZhzpT2C65rCi1hP98UrWIZ
+ayG/pLKrelkwPV7q8uv04jTTvrsQ7/yEXP7lBBJzOto2gFO8McRWLelXifMLpymq
+WHQp9oc4Yot3w0zpWOpxJmSBvG6ZYkvGTcrm0BCpaajzUzclzE/d1LAU6fpqOJhD
+XWeVhl+D21gSk7sfRZYpqsmCTHvLWuiYb61yEWNsw3oWc0VhLxGl0m7X6Ktg8/P9
+ELayujSuJTdUR7XkI1gDoQcDSXUtS1LSFflZioIpGkWqThJK0xMgzPiILFBIC+1Y
+3OUSKCPOv354+73W1S/0vzVVOhoZINieiIqWUfjd9fvwhDh+dgMy8vqWlvotxC4t
+qYxCVASgopFl5DgNWBYhPFhZ14pcLbA3kCdPiLc4J8+nU0u6wRo44Q2upKoCgakD
+uafWTh40ahihItdSCpDFKWI0p9BN/vS5Y/ee3un7cNQQM1/3BxQLKNIMrGZkk9OP
+VK+E/EQMEFDtCClaptaShjow8h1o3BtXFV9HYvmf1o8c4mb5Eej/o0rBN1rWRtPX
+UsbrSQaeNdATiNbrOMmjCMmMfM+CuXFtksfqp1UJsVBRqddRyNJwhGbfuWkNcwAA
+xW5M5myOkproxBCqOW+9/Qgp/NrQ/LDhV4w8wemEi5sodEZrtyy1QNI08FxNWEYi
+S9TI8YEsFiT8K3TNb9evwZq3kKx/S8MtRpZa+Dh7kVy8SMKjFL+TLP0Fsns/Jfoi
+e3FxeZzStaqr97H6tJ/S87Msfn52nBLk+T9j6Fch+f13sndX7Wc0vVg+m16EfrCj
+kyyAc3dL8xFg4Dllk9zpqY1XsspZkpNYUjgIaSIhwik4i6whFkAWoqGSSxcVq5yW
+pIpvQDFFsDbQ1FHzK9uvlj9E5wdQyaJ6kaIJnL8K2EhFUheQlRNgcw1L8PNbcDrE
+dfi0I9FEEiiIeM1jo8YAFyemkk+6nvLG2crnfb9hrx2e2WUnL3ObYu5rckCPbR0o
+3ytp+PhlkmVpE9L9nHojigpykxKoESQkT52Hb00UfYDn0Poy7BXAHg1TVIbtpi2O
+rsM0KpqKtlXQ6iqNNY38gm1s46qSK3h/f/fTj9jjlQc5GlkjQuN8zwoKB+7IEjsh
+F6453G9XUcdvsw1idwzsXjCaQFSWLSNog7tFHU2SWENJNTUJoRqLmAW7PBrtVrsQ
+0hOiUbZt7S5128EAmqA3EYy64m3Fb3QdbA4ITTcw6pnNbyzFReD83LDYVnqz9yd5
+XX7yAzKRFOzhYjIKgRiMlpq6MDHgE1ZCQ/z+/Q9vAbGhPeznKs4qFhjWNBKGTizX
+78w9ipCvOY/CiR+ABqlraCZv+xOEE9gFf696mIRmKQ64SkuwUnQ2+tAvchsp+tAS
+0JsL9mVtkLESAgyiGirhm5zxNOrpbrE3hkKrMKfljc7JN/3IeNrfnflx4tHanhnd
+jr1laKaOr4hoj1AT0/buysWAmdhBXLdowf+Nkd3aCifkidXLgY/x9sIL937uuPyG
+D0d0e8S0bGDI9GQc9YTnBtaTe9MqOKA4+ob4O1HLhG7loF9ZbCzYKFQG3E3NHgGY
+EvFBBQbBQk1EWVClsAUuSEQ3x7RHuysinQDjeNQfthzBhAvlZHKlefdgaR28VYV7
+fQIH2XDHYArugjSIoO6WddFD1Xgg+sjSA20swPBlqbVCh4OD6zEshAkaF1lGE9O0
+Hi2CYLRZvlgKQh4iCdtYFH1CnS8dB2R5gAduP5xLR2wzZtwIQydw0AQC3Qacxz+m
+q/IQAwAZQ6yWmPG+VRG1rvgxVABpETfMuuirfLAuhjeS0tKOGz4NM/oXZtnp4kh0
+p2jENk+chibQ2ml3QxoXbQ8SB8ZQTcOjfO35vYMDaxyF21AvCA4IjVGDM3Tf/V9k
+WJieO74djS827BENfUBXM+anzdXFPGW3JOGxUovQ+5cixOsNb6v9TwE3BnO8MCEF
+1blIFwHEXkBiU0AWAd5TBQamww66y2yztb3XXmzZ/cHcXP8Qva7oItBwZg9IGRfw
+G8ujQn7W2uCCPgudgygcZqJ3FU1YtsZTCcFlooX5jXDQuHABnrBjEJFBRYHMYRmj
+Uu2SwF6htby6GzUnB8bKk8cvLy6fv3IKnoKG9pf9E4kUNdcMZvOevHj3BwjzR+Px
+u/gWzlK4qsZjR8OiGmM29OanaPoN+4befx6hJWdXxj5u++0Z3//XJzjiWTS9KSjO
+FebqzKnrG8sm1D6HoXBuDcQ7im7um3vIZuUhqKZL1EXpxQoDnVyTOobt6v9ufNOu
+tin4gQoafvIwYZxOaC44HJkXAd4OGLA2orw7zyN0DaTaR/ln3IXzn1TEpRQE1XJN
+Xj2QUxPolhd4vmXU9qE2CdqbU2uXXrP6EsquTR2i60B6CYBhfDXoVyn/j8XQYOOM
+bjPCDFwmI1witF/2Nnd+av4Z/h8td0GI"""